@@ -0,0 +1,123 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+class Saturated(Exception):
+    """
+    Raised when a render cannot be admitted. retry_after is the number of
+    seconds after which the client could reasonably try again.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RenderScheduler:
+    """
+    Admission control in front of the renderer. At most max_concurrent
+    renders run at a time and the estimated memory of the running ones,
+    their cost in bytes, stays within max_bytes. Requests that don't fit
+    wait their turn in a FIFO queue of at most max_queue entries, for at most
+    max_wait seconds; beyond that they are rejected with Saturated straight
+    away, so a burst is answered with quick 503s instead of piling up.
+    """
+    def __init__(self, max_concurrent=4, max_bytes=256 * 1024 * 1024, max_queue=16, max_wait=2.0):
+        self.max_concurrent = max_concurrent
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.active_bytes = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # Moving average of how long a render holds its slot, for Retry-After
+        self.hold_seconds = 1.0
+        self._waiting = deque()
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configures the scheduler from PDF_MAX_RENDERS, PDF_RENDER_MEMORY,
+        PDF_RENDER_QUEUE and PDF_RENDER_WAIT
+        """
+        return cls(
+            max_concurrent=int(os.environ.get('PDF_MAX_RENDERS', os.cpu_count() or 1)),
+            max_bytes=int(os.environ.get('PDF_RENDER_MEMORY', 256 * 1024 * 1024)),
+            max_queue=int(os.environ.get('PDF_RENDER_QUEUE', 16)),
+            max_wait=float(os.environ.get('PDF_RENDER_WAIT', 2.0)),
+        )
+
+    def _fits(self, cost):
+        return self.active < self.max_concurrent and self.active_bytes + cost <= self.max_bytes
+
+    def retry_after(self):
+        """
+        Seconds until the queue ahead of a new request has likely drained
+        """
+        backlog = (len(self._waiting) + self.active) / self.max_concurrent
+        return max(1, math.ceil(backlog * self.hold_seconds))
+
+    def _reject(self, message):
+        self.rejected += 1
+        raise Saturated(message, self.retry_after())
+
+    def acquire(self, cost):
+        """
+        Waits for a slot for a render of the given cost and takes it. Returns
+        a token to hand back to release once the render is done. Raises
+        Saturated when the queue is full or the wait times out.
+        """
+        # A single render larger than the whole budget still runs, alone
+        cost = min(cost, self.max_bytes)
+        with self._condition:
+            if not self._waiting and self._fits(cost):
+                return self._admit(cost)
+            if len(self._waiting) >= self.max_queue:
+                self._reject("Too many renders queued")
+
+            ticket = object()
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while not (self._waiting[0] is ticket and self._fits(cost)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        self._reject("Timed out waiting for a render slot")
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # The next in line may fit now that this one is gone
+                self._condition.notify_all()
+            return self._admit(cost)
+
+    def _admit(self, cost):
+        self.active += 1
+        self.active_bytes += cost
+        self.admitted += 1
+        return cost, time.monotonic()
+
+    def release(self, token):
+        """
+        Gives back the slot taken by acquire
+        """
+        cost, started = token
+        with self._condition:
+            self.active -= 1
+            self.active_bytes -= cost
+            self.hold_seconds += 0.2 * (time.monotonic() - started - self.hold_seconds)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self.active,
+                'active_bytes': self.active_bytes,
+                'queued': len(self._waiting),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
@@ -1,82 +1,96 @@
-from flask import Flask, render_template_string, request, send_file
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from io import BytesIO
-from PIL import Image, ImageDraw
-import base64
+from flask import Flask, Response, render_template_string, request, send_file
+from werkzeug.exceptions import UnsupportedMediaType
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
+from io import BytesIO, StringIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+import cProfile
+import json
+import logging
+import marshal
+import multiprocessing
 import os
-import tempfile
+import pstats
+import threading
+import time
+import zipfile
+from admission import RenderScheduler, Saturated
+from render_cache import RenderCache, cache_key
+from resume import Resume, decode_photo
+from streaming import iter_chunks, stream_render, tee_to_cache
+from jobs import DONE, ExecutorJobQueue, SQLiteJobQueue, failed_future
+from static_page import StaticPage
+from metrics import observe, output, registry, span
+from schema import compile_schema
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+render_cache = RenderCache.from_env()
+
+# Admission control for renders, so a burst of large photos gets 503s
+# instead of exhausting the worker's memory
+render_scheduler = RenderScheduler.from_env()
+
+def _text(max_length):
+    return {'type': 'string', 'maxLength': max_length}
+
+def _entries(properties, required, max_items=200):
+    return {
+        'type': 'array',
+        'maxItems': max_items,
+        'items': {
+            'type': 'object',
+            'properties': properties,
+            'required': required,
+            'additionalProperties': False,
+        },
+    }
+
+# Body of /api/v1/resume. Education, experience and skills are lists of
+# objects rather than the parallel lists of the form, so entries can't get
+# out of step.
+RESUME_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'name': _text(200),
+        'title': _text(200),
+        'about': _text(10000),
+        'phone': _text(200),
+        'email': _text(200),
+        'address': _text(500),
+        'education': _entries(
+            {'years': _text(100), 'school': _text(500), 'location': _text(500)},
+            ['school']
+        ),
+        'experience': _entries(
+            {'years': _text(100), 'position': _text(500), 'description': _text(10000)},
+            ['position']
+        ),
+        'skills': _entries(
+            {'name': _text(200), 'level': {'type': 'number', 'minimum': 0, 'maximum': 100}},
+            ['name', 'level'], max_items=50
+        ),
+        # base64, or a separate multipart part named photo
+        'photo': {'type': 'string'},
+        'output_profile': {'type': 'string'},
+        'theme': {'type': 'string'},
+    },
+    'required': ['name'],
+    'additionalProperties': False,
+}
+
+validate_resume = compile_schema(RESUME_SCHEMA)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def wrap_text(text, width, c, x_pos, y_pos, font_name="Helvetica", font_size=10):
-    """
-    Wraps text to maximum 25 characters per line
-    """
-    c.setFont(font_name, font_size)
-    words = text.split()
-    line = ""
-    char_count = 0
-    max_chars = 25
-    
-    for word in words:
-        test_line = f"{line} {word}".strip()
-        if len(test_line) > max_chars:
-            if len(line) > max_chars:
-                print(f"Warning: Line exceeds {max_chars} characters: '{line}'")
-            if line:
-                c.drawString(x_pos, y_pos, line[:max_chars])
-                y_pos -= font_size + 4
-            line = word
-            char_count = len(word)
-        else:
-            line = test_line
-            char_count = len(line)
-    
-    if line:
-        if len(line) > max_chars:
-            print(f"Warning: Line exceeds {max_chars} characters: '{line}'")
-            c.drawString(x_pos, y_pos, line[:max_chars])
-        else:
-            c.drawString(x_pos, y_pos, line)
-        y_pos -= font_size + 4
-    
-    return y_pos
-
-# Function for text wrapping with character limit
-def wrap_text_with_limit(text, width, c, x_pos, y_pos, font_name="Helvetica", font_size=10):
-    c.setFont(font_name, font_size)
-    words = text.split()
-    line = ""
-    max_chars = 25  # Character limit per line
-    
-    for word in words:
-        test_line = f"{line} {word}".strip()
-        if len(test_line) > max_chars:
-            if line:
-                c.drawString(x_pos, y_pos, line[:max_chars])
-                y_pos -= font_size + 4
-            line = word
-        else:
-            line = test_line
-    
-    if line:
-        if len(line) > max_chars:
-            c.drawString(x_pos, y_pos, line[:max_chars])
-        else:
-            c.drawString(x_pos, y_pos, line)
-        y_pos -= font_size + 4
-    
-    return y_pos
-
 template = """
 <!DOCTYPE html>
 <html lang="en">
@@ -389,216 +403,670 @@ template = """
 </html>
 """
 
-def create_pdf(data, photo=None):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
+# The form page has no dynamic content, so it is rendered and compressed
+# once at startup instead of on every request
+with app.test_request_context():
+    home_page = StaticPage(render_template_string(template))
+
+# Rendering needs ReportLab and Pillow, which take longer to import than
+# everything else together and which the form page doesn't use. On
+# serverless platforms, where every cold start counts, rendering.py is
+# imported by the first request that renders. Elsewhere it is imported and
+# warmed up right away, so gunicorn workers forked from the preloaded app
+# (see gunicorn.conf.py) start out warm and share it all copy-on-write.
+LAZY_IMPORTS = os.environ.get('PDF_LAZY_IMPORTS', '1' if os.environ.get('VERCEL') else '0') == '1'
+
+def renderer():
+    """
+    The rendering module, imported on first use
+    """
+    import rendering
+    return rendering
+
+if not LAZY_IMPORTS:
+    renderer().warm_up()
+
+# Moved to rendering.py, still importable from here without importing
+# rendering up front
+_RENDERING_NAMES = {'create_pdf', 'create_book', 'create_png', 'create_svg', 'layout_sessions', 'themes',
+                    'PREVIEW_WIDTH', 'MAX_PREVIEW_WIDTH'}
 
-    # Add black sidebar with slightly reduced width
-    sidebar_width = width / 3 - 10
-    c.setFillColorRGB(0.1, 0.1, 0.1)
+def __getattr__(name):
+    if name in _RENDERING_NAMES:
+        return getattr(renderer(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    # Name section dimensions
-    name_section_height = 120
+def request_session():
+    """
+    The LayoutSession named by the request's session parameter, if any
+    """
+    session_id = request.values.get('session')
+    return renderer().layout_sessions.get(session_id) if session_id else None
 
-    # Draw black background as one piece for sidebar and name section
-    c.rect(0, 0, sidebar_width, height, fill=1)
-    c.rect(sidebar_width, height - name_section_height, width - sidebar_width, name_section_height, fill=1)
+def admit_render(photo_bytes, cost=None):
+    """
+    Waits until the render scheduler admits a render with this photo and
+    returns the token to release once it is done. cost replaces the
+    estimate for renders of more than one resume. Raises Saturated when
+    the server is too busy.
+    """
+    start = time.perf_counter()
+    if cost is None:
+        cost = renderer().render_cost(photo_bytes)
+    token = render_scheduler.acquire(cost)
+    observe('queue', time.perf_counter() - start)
+    return token
 
-    # Calculate right width after sidebar width is defined
-    right_width = width - sidebar_width - 40  # Adjusted width for content
+def busy_response(e, as_json=False):
+    """
+    The 503 for a render the scheduler turned away
+    """
+    headers = {'Retry-After': str(e.retry_after)}
+    if as_json:
+        return {'error': f"Server busy: {str(e)}"}, 503, headers
+    return f"Server busy: {str(e)}", 503, headers
 
-    # Calculate photo dimensions and position
-    photo_size = int(sidebar_width - 40)
-    photo_x = 20
-    photo_y = height - photo_size - 20
+def render_pdf_bytes(data, photo_bytes=None, output_profile=None, theme=None):
+    return renderer().render_pdf_bytes(data, photo_bytes, output_profile, theme)
 
-    # Handle photo if provided
-    if photo:
+def render_job(data, photo_bytes=None):
+    """
+    Renders a /jobs job on a thread of this process, under the render
+    scheduler like the requests. Nobody is waiting on a 503 here, so a job
+    the scheduler turns away sleeps for its Retry-After and tries again,
+    leaving the queue to the requests meanwhile.
+    """
+    cost = renderer().render_cost(photo_bytes)
+    while True:
         try:
-            photo.seek(0)
-            img = Image.open(photo)
-            print(f"Image opened successfully. Mode: {img.mode}, Size: {img.size}")
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize to fit the space
-            img = img.resize((photo_size, photo_size), Image.Resampling.LANCZOS)
-            
-            # Save to temporary file
-            temp_dir = tempfile.gettempdir()
-            temp_img_path = os.path.join(temp_dir, "temp_photo.png")
-            img.save(temp_img_path, format='PNG')
-            
-            # Draw in PDF
-            c.drawImage(temp_img_path, photo_x, photo_y, width=photo_size, height=photo_size)
-            
-            # Clean up temporary file
-            os.remove(temp_img_path)
-            
+            token = render_scheduler.acquire(cost)
+            break
+        except Saturated as e:
+            time.sleep(e.retry_after)
+    try:
+        return render_pdf_bytes(data, photo_bytes)
+    finally:
+        render_scheduler.release(token)
+
+def record_photo(record):
+    """
+    Decodes the optional base64 'photo' key of a JSON resume record. Raises
+    ValueError if it isn't a base64 string.
+    """
+    photo = record.get('photo')
+    return decode_photo(photo) if photo else None
+
+def render_record(record, output_profile=None, theme=None):
+    """
+    Renders a single JSON resume record to PDF bytes
+    """
+    return render_pdf_bytes(Resume.from_data(record), record_photo(record), output_profile, theme)
+
+# Process pool for batch rendering, created on first use. ReportLab renders
+# in pure Python, so threads would all queue up behind the GIL. The workers
+# come from a forkserver rather than being forked from the web process: by
+# the time the pool is created the server's threads are running, and a
+# child forked while one of them holds a lock would hang on that lock.
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _render_pool
+
+def replace_render_pool(broken):
+    """
+    Drops a pool left broken by a worker that died (killed for memory, a
+    crash in a native decoder) and returns a fresh one. The records that
+    were in flight fail with BrokenProcessPool.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is broken:
+            _render_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    return get_render_pool()
+
+def render_batch(records, executor=None, output_profile=None, theme=None):
+    """
+    Renders resume records across the process pool and yields
+    (index, pdf_bytes, error) tuples in input order. Only a small window of
+    records is in flight at a time so results don't pile up in memory.
+    """
+    own_pool = executor is None
+    executor = executor or get_render_pool()
+    window = 2 * (os.cpu_count() or 1)
+    pending = deque()
+    records = iter(records)
+    index = 0
+
+    while True:
+        while len(pending) < window:
+            record = next(records, None)
+            if record is None:
+                break
+            try:
+                future = executor.submit(render_record, record, output_profile, theme)
+            except BrokenProcessPool as e:
+                if own_pool:
+                    executor = replace_render_pool(executor)
+                    future = executor.submit(render_record, record, output_profile, theme)
+                else:
+                    future = failed_future(e)
+            pending.append((index, future))
+            index += 1
+        if not pending:
+            return
+        i, future = pending.popleft()
+        try:
+            yield i, future.result(), None
         except Exception as e:
-            print(f"Error processing photo: {str(e)}")
-            # Draw white circle as fallback
-            c.setFillColorRGB(1, 1, 1)
-            c.circle(photo_x + photo_size/2, photo_y + photo_size/2, photo_size/2, fill=1)
-    else:
-        # Draw white circle if no photo
-        c.setFillColorRGB(1, 1, 1)
-        c.circle(photo_x + photo_size/2, photo_y + photo_size/2, photo_size/2, fill=1)
-    
-    # Start content below photo circle
-    y_position = height - name_section_height - 60  # Adjusted to start at the top of the black rectangle
-
-    # Draw Name and Title at the center of the black rectangle
-    center_x_position = sidebar_width + (right_width / 2)  # Center position in the black rectangle
-    name_x_position = center_x_position - (c.stringWidth(data['name']) / 2)  # Center the name
-    title_y_position = height - 70 # Adjust this value to move the title higher or lower
-    title_x_position = center_x_position - (c.stringWidth(data['title']) / 2)  # Center the title
-
-    c.setFont("Helvetica-Bold", 20)
-    c.setFillColorRGB(1, 1, 1)  # White color for text
-    c.drawString(name_x_position, title_y_position, data['name'])  # Draw name
-    title_y_position -= 25  # Move down for title
-    c.setFont("Helvetica", 16)
-    c.drawString(title_x_position, title_y_position, data['title'])  # Draw title
-
-    # Adjust "About Me" section position
-    y_position += -5  # Increase this value to move "About Me" section down
-
-    # About me section
-    c.setFont("Helvetica-Bold", 16)
-    c.setFillColorRGB(1, 1, 1)
-    c.drawString(20, y_position, "About me")
-    y_position -= 25
-    
-    # About text with wrapping
-    y_position = wrap_text(data['about'], sidebar_width - 40, c, 20, y_position, "Helvetica", 10)
-    
-    # Contact section
-    y_position -= 20
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(20, y_position, "Contact")
-    y_position -= 25
-    
-    # Contact details with wrapping
-    c.setFont("Helvetica", 10)
-    y_position = wrap_text(data['phone'], sidebar_width - 40, c, 20, y_position)
-    y_position = wrap_text(data['email'], sidebar_width - 40, c, 20, y_position)
-    y_position = wrap_text(data['address'], sidebar_width - 40, c, 20, y_position)
-    
-    # Expertise section
-    y_position -= 20
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(20, y_position, "Expertise")
-    y_position -= 25
-    
-    # Draw skill bars
-    c.setFont("Helvetica", 10)
-    for name, level in zip(data['skill_names'], data['skill_levels']):
-        y_position = wrap_text(name, sidebar_width - 40, c, 20, y_position)
-        # Draw skill bar background
-        c.setFillColorRGB(0.3, 0.3, 0.3)
-        c.rect(20, y_position - 10, 80, 5, fill=1)
-        # Draw skill level
-        c.setFillColorRGB(1, 1, 1)
-        level_width = (float(level) / 100) * 80
-        c.rect(20, y_position - 10, level_width, 5, fill=1)
-        y_position -= 25
-
-    # Main content area (right side)
-    right_margin = sidebar_width + 40  # Adjusted margin
-    main_y_position = height - name_section_height - 60  # Start below black header
-    right_width = width - right_margin - 40  # Adjusted width for content
-    
-    # Education section in white area
-    c.setFillColorRGB(0, 0, 0)  # Black text
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(right_margin, main_y_position, "Education")
-    main_y_position -= 30
-    
-    # Education entries with adjusted wrapping
-    for i in range(len(data['edu_years'])):
-        # Timeline dot
-        c.circle(right_margin - 15, main_y_position + 5, 3, fill=1)
-        
-        c.setFont("Helvetica-Bold", 12)
-        main_y_position = wrap_text_with_limit(data['edu_years'][i], right_width, c, right_margin, main_y_position, "Helvetica-Bold", 12)
-        c.setFont("Helvetica", 10)
-        main_y_position = wrap_text_with_limit(data['edu_school'][i], right_width, c, right_margin, main_y_position)
-        main_y_position = wrap_text_with_limit(data['edu_location'][i], right_width, c, right_margin, main_y_position)
-        main_y_position -= 25  # Increased spacing between entries
-
-    # Experience section in white area
-    main_y_position -= 30  # Extra space before Experience section
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(right_margin, main_y_position, "Experience")
-    main_y_position -= 30
-    
-    # Experience entries with adjusted wrapping
-    for i in range(len(data['exp_years'])):
-        # Timeline dot
-        c.circle(right_margin - 15, main_y_position + 5, 3, fill=1)
-        
-        c.setFont("Helvetica-Bold", 12)
-        main_y_position = wrap_text_with_limit(data['exp_years'][i], right_width, c, right_margin, main_y_position, "Helvetica-Bold", 12)
-        c.setFont("Helvetica", 10)
-        main_y_position = wrap_text_with_limit(data['exp_position'][i], right_width, c, right_margin, main_y_position)
-        main_y_position = wrap_text_with_limit(data['exp_description'][i], right_width, c, right_margin, main_y_position)
-        main_y_position -= 25  # Increased spacing between entries
-
-    c.save()
-    buffer.seek(0)
-    return buffer
+            yield i, None, e
+
+class _ChunkWriter:
+    """
+    Write-only file object collecting output so it can be yielded in chunks
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_batch_zip(records, executor=None, output_profile=None, theme=None):
+    """
+    Yields a ZIP archive of the rendered resumes chunk by chunk, one PDF per
+    record. Records that fail to render are listed in errors.txt.
+    """
+    records = list(records)
+    out = _ChunkWriter()
+    errors = []
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, pdf, error in render_batch(records, executor, output_profile, theme):
+            name = secure_filename(records[i].get('name', '')) or 'resume'
+            if error is not None:
+                errors.append(f"{i:04d} {name}: {error}")
+            else:
+                archive.writestr(f"{i:04d}_{name}.pdf", pdf)
+            yield out.drain()
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+    yield out.drain()
 
 @app.route('/')
 def home():
-    return render_template_string(template)
+    return home_page.response(request)
+
+def parse_form():
+    """
+    Builds the Resume and reads the photo from the submitted form
+    """
+    data = {
+        'name': request.form['name'],
+        'title': request.form['title'],
+        'about': request.form['about'],
+        'phone': request.form['phone'],
+        'email': request.form['email'],
+        'address': request.form['address'],
+        'edu_years': request.form.getlist('edu_years[]'),
+        'edu_school': request.form.getlist('edu_school[]'),
+        'edu_location': request.form.getlist('edu_location[]'),
+        'exp_years': request.form.getlist('exp_years[]'),
+        'exp_position': request.form.getlist('exp_position[]'),
+        'exp_description': request.form.getlist('exp_description[]'),
+        'skill_names': request.form.getlist('skill_names[]'),
+        'skill_levels': request.form.getlist('skill_levels[]')
+    }
+
+    photo_bytes = None
+    if 'photo' in request.files:
+        file = request.files['photo']
+        if file and file.filename != '':
+            # Read the image directly into memory
+            photo_bytes = file.read()
+            logger.debug("Photo loaded: %d bytes", len(photo_bytes))
+    return Resume.from_data(data), photo_bytes
+
+def stream_pdf(data, photo_bytes, key, cached=None, output_profile=None, session=None, theme=None):
+    """
+    Streaming variant of the /generate response. Headers go out straight
+    away and the PDF follows in chunks as the canvas writes it, instead of
+    being buffered whole before send_file.
+    """
+    if cached is not None:
+        chunks = iter_chunks(cached)
+    else:
+        photo = BytesIO(photo_bytes) if photo_bytes else None
+        token = admit_render(photo_bytes)
+
+        def render(*args, **kwargs):
+            # Holds the slot until the render thread is done, not only
+            # until the client has read the response
+            try:
+                return renderer().create_pdf(*args, **kwargs)
+            finally:
+                render_scheduler.release(token)
+
+        # tee_to_cache keeps the whole PDF anyway, so the render doesn't
+        # wait for the client and gives back its slot as soon as it is done
+        chunks = stream_render(
+            render, data, photo, max_chunks=0, output_profile=output_profile, session=session, theme=theme
+        )
+        chunks = tee_to_cache(chunks, render_cache, key)
+
+    response = Response(
+        chunks,
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': 'attachment; filename=resume.pdf',
+            'ETag': f'"{key}"',
+            'X-Cache': 'HIT' if cached is not None else 'MISS',
+        },
+        direct_passthrough=True
+    )
+    registry.inc('pdf_requests_total')
+    timed_send(response)
+    return response
 
 @app.route('/generate', methods=['POST'])
 def generate_pdf():
+    if request.args.get('profile') and profiling_enabled():
+        return profile_generate()
     try:
-        data = {
-            'name': request.form['name'],
-            'title': request.form['title'],
-            'about': request.form['about'],
-            'phone': request.form['phone'],
-            'email': request.form['email'],
-            'address': request.form['address'],
-            'edu_years': request.form.getlist('edu_years[]'),
-            'edu_school': request.form.getlist('edu_school[]'),
-            'edu_location': request.form.getlist('edu_location[]'),
-            'exp_years': request.form.getlist('exp_years[]'),
-            'exp_position': request.form.getlist('exp_position[]'),
-            'exp_description': request.form.getlist('exp_description[]'),
-            'skill_names': request.form.getlist('skill_names[]'),
-            'skill_levels': request.form.getlist('skill_levels[]')
-        }
-        
-        photo = None
-        if 'photo' in request.files:
-            file = request.files['photo']
-            if file and file.filename != '':
-                # Read the image directly into memory
-                photo = BytesIO(file.read())
-                print("Photo loaded successfully")  # Debug print
-
-        pdf = create_pdf(data, photo)
-        
-        return send_file(
-            pdf,
-            download_name='resume.pdf',
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        with span('parse'):
+            try:
+                data, photo_bytes = parse_form()
+                rendering = renderer()
+                profile = rendering.get_profile(request.values.get('output_profile'))
+                theme = rendering.get_theme(request.values.get('theme'))
+            except (KeyError, ValueError) as e:
+                return f"Invalid form: {str(e)}", 400
+        return pdf_response(data, photo_bytes, profile, theme)
+    except Saturated as e:
+        return busy_response(e)
     except Exception as e:
-        print(f"Error generating PDF: {str(e)}")
+        logger.exception("Error generating PDF")
+        registry.inc('pdf_errors_total')
         return f"An error occurred while generating the PDF: {str(e)}", 500
 
+def pdf_response(data, photo_bytes, profile, theme):
+    """
+    The PDF response shared by /generate and /api/v1/resume: answered from
+    the render cache when possible, streamed with ?stream=1
+    """
+    # Identical submissions map to the same key, which doubles as the ETag.
+    # The theme's digest changes with its file, unlike its name.
+    key = cache_key(
+        data, photo_bytes, output_profile=profile.name, theme=theme.digest, invariant=renderer().is_invariant()
+    )
+    if key in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{key}"'})
+
+    pdf = render_cache.get(key)
+    if request.values.get('stream') == '1':
+        return stream_pdf(data, photo_bytes, key, pdf, profile.name, request_session(), theme)
+
+    cache_status = 'HIT'
+    if pdf is None:
+        cache_status = 'MISS'
+        photo = BytesIO(photo_bytes) if photo_bytes else None
+        token = admit_render(photo_bytes)
+        try:
+            pdf = renderer().create_pdf(
+                data, photo, output_profile=profile.name, session=request_session(), theme=theme
+            ).getvalue()
+        finally:
+            render_scheduler.release(token)
+        render_cache.put(key, pdf)
+
+    response = send_file(
+        BytesIO(pdf),
+        download_name='resume.pdf',
+        as_attachment=True,
+        mimetype='application/pdf',
+        etag=key
+    )
+    response.headers['X-Cache'] = cache_status
+    registry.inc('pdf_requests_total')
+    timed_send(response)
+    return response
+
+@app.route('/api/v1/resume', methods=['POST'])
+def api_resume():
+    """
+    Renders a resume sent as JSON. The body is either application/json,
+    read straight from the request stream without any form parsing, or
+    multipart with the JSON in a part named resume and the photo in a file
+    part named photo. Errors are returned as JSON.
+    """
+    try:
+        with span('parse'):
+            try:
+                body, data, photo_bytes = parse_api_request()
+                rendering = renderer()
+                profile = rendering.get_profile(body.get('output_profile', request.args.get('output_profile')))
+                theme = rendering.get_theme(body.get('theme', request.args.get('theme')))
+            except UnsupportedMediaType as e:
+                return {'error': e.description}, 415
+            except ValueError as e:
+                # Also covers malformed JSON and base64
+                return {'error': str(e)}, 400
+        return pdf_response(data, photo_bytes, profile, theme)
+    except Saturated as e:
+        return busy_response(e, as_json=True)
+    except Exception as e:
+        logger.exception("Error generating PDF")
+        registry.inc('pdf_errors_total')
+        return {'error': f"An error occurred while generating the PDF: {str(e)}"}, 500
+
+def parse_api_request():
+    """
+    Decodes and validates an /api/v1/resume request. Returns the JSON body,
+    the resume data dict built from it and the photo bytes, if any.
+    """
+    photo_bytes = None
+    if request.mimetype == 'application/json':
+        body = json.loads(request.get_data(cache=False))
+    elif request.mimetype == 'multipart/form-data':
+        if 'resume' not in request.form:
+            raise ValueError("Missing the 'resume' part")
+        body = json.loads(request.form['resume'])
+        photo = request.files.get('photo')
+        if photo and photo.filename != '':
+            photo_bytes = photo.read()
+    else:
+        raise UnsupportedMediaType("Expected application/json or multipart/form-data")
+
+    validate_resume(body)
+    if 'photo' in body:
+        if photo_bytes is not None:
+            raise ValueError("Send the photo either as base64 or as a separate part, not both")
+        photo_bytes = decode_photo(body['photo'])
+    return body, Resume.from_dict(body), photo_bytes
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    """
+    Quick preview of a resume for live editing: the first page (or ?page=N)
+    as a low resolution PNG, ?width= pixels wide, or with ?format=svg the
+    whole resume as SVG. Takes the /generate form or an /api/v1/resume body,
+    and a session parameter to lay out only what changed since the last
+    preview of the same session.
+    """
+    fmt = request.args.get('format', 'png')
+    with output(fmt if fmt in ('png', 'svg') else 'png'):
+        return _preview(fmt)
+
+def _preview(fmt):
+    try:
+        rendering = renderer()
+        with span('parse'):
+            try:
+                if request.mimetype == 'application/json' or 'resume' in request.form:
+                    body, data, photo_bytes = parse_api_request()
+                    theme = rendering.get_theme(body.get('theme', request.args.get('theme')))
+                else:
+                    data, photo_bytes = parse_form()
+                    theme = rendering.get_theme(request.values.get('theme'))
+                if fmt not in ('png', 'svg'):
+                    raise ValueError("format must be png or svg")
+                page = request.args.get('page', 1, type=int)
+                if page < 1:
+                    raise ValueError("page must be 1 or more")
+                page -= 1
+                width = request.args.get('width', rendering.PREVIEW_WIDTH, type=int)
+                width = min(max(width, 50), rendering.MAX_PREVIEW_WIDTH)
+            except (KeyError, ValueError) as e:
+                return f"Invalid preview request: {str(e)}", 400
+
+        key = cache_key(data, photo_bytes, preview=fmt, page=page, width=width, theme=theme.digest)
+        if key in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{key}"'})
+
+        photo = BytesIO(photo_bytes) if photo_bytes else None
+        token = admit_render(photo_bytes)
+        try:
+            if fmt == 'svg':
+                body = rendering.create_svg(data, photo, request_session(), theme)
+            else:
+                body = rendering.create_png(data, photo, page, width, request_session(), theme)
+        finally:
+            render_scheduler.release(token)
+        if body is None:
+            return "No such page", 404
+        response = Response(body, mimetype='image/svg+xml' if fmt == 'svg' else 'image/png')
+        response.set_etag(key)
+        registry.inc('preview_requests_total')
+        return response
+    except Saturated as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.exception("Error generating preview")
+        registry.inc('preview_errors_total')
+        return f"An error occurred while generating the preview: {str(e)}", 500
+
+def timed_send(response):
+    # The WSGI server closes the body iterable once it has been sent.
+    # send_file responses are passed through as is, so call_on_close would
+    # never fire for them.
+    start = time.perf_counter()
+    response.response = ClosingIterator(
+        response.response, lambda: observe('send', time.perf_counter() - start)
+    )
+
+def profiling_enabled():
+    return app.debug or os.environ.get('PDF_PROFILING') == '1'
+
+def profile_generate():
+    """
+    Renders the submitted form under cProfile, bypassing the render cache,
+    and returns the profile instead of the PDF: a text report sorted by
+    cumulative time, or the raw pstats dump with ?profile=raw
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        data, photo_bytes = parse_form()
+        render_pdf_bytes(data, photo_bytes, request.values.get('output_profile'), request.values.get('theme'))
+    finally:
+        profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    if request.args.get('profile') == 'raw':
+        # marshal dump readable with pstats.Stats(path) or snakeviz
+        return Response(
+            marshal.dumps(stats.stats),
+            mimetype='application/octet-stream',
+            headers={'Content-Disposition': 'attachment; filename=generate.prof'}
+        )
+    report = StringIO()
+    stats.stream = report
+    stats.sort_stats('cumulative').print_stats(50)
+    return Response(report.getvalue(), mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics():
+    cache = render_cache.stats()
+    extra = {
+        'pdf_cache_hits_total': cache['hits'],
+        'pdf_cache_disk_hits_total': cache['disk_hits'],
+        'pdf_cache_misses_total': cache['misses'],
+        'pdf_cache_entries': cache['entries'],
+        'pdf_cache_bytes': cache['bytes'],
+    }
+    scheduler = render_scheduler.stats()
+    extra.update({
+        'render_active': scheduler['active'],
+        'render_active_bytes': scheduler['active_bytes'],
+        'render_queue_depth': scheduler['queued'],
+        'render_admitted_total': scheduler['admitted'],
+        'render_rejected_total': scheduler['rejected'],
+        'render_queue_timeouts_total': scheduler['timeouts'],
+    })
+    return Response(registry.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    return render_cache.stats()
+
+@app.route('/themes')
+def list_themes():
+    return {name: theme.description for name, theme in renderer().themes.items()}
+
+# Queue behind /jobs, created on first use. JOB_QUEUE picks the backend:
+# thread (default) or process pools in this process, or sqlite, where
+# `python jobs.py worker` processes render the queued jobs. Renders on
+# threads of this process go through the render scheduler; the process
+# pool is bounded by its own size.
+_job_queue = None
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        kind = os.environ.get('JOB_QUEUE', 'thread')
+        ttl = int(os.environ.get('JOB_TTL', 3600))
+        limits = {
+            'max_pending': int(os.environ.get('JOB_MAX_PENDING', 64)),
+            'max_result_bytes': int(os.environ.get('JOB_RESULT_BYTES', 256 * 1024 * 1024)),
+        }
+        if kind == 'sqlite':
+            _job_queue = SQLiteJobQueue(
+                os.environ.get('JOB_DB', 'jobs.sqlite3'), render_job, ttl=ttl,
+                workers=int(os.environ.get('JOB_WORKERS', 0))
+            )
+        elif kind == 'process':
+            _job_queue = ExecutorJobQueue(
+                get_render_pool(), render_pdf_bytes, ttl=ttl, replace_executor=replace_render_pool, **limits
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+            _job_queue = ExecutorJobQueue(executor, render_job, ttl=ttl, **limits)
+    return _job_queue
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    # Accepts the same form as /generate, or a JSON resume record
+    try:
+        if request.is_json:
+            record = request.get_json()
+            data, photo_bytes = Resume.from_data(record), record_photo(record)
+        else:
+            data, photo_bytes = parse_form()
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        return f"Invalid resume: {str(e)}", 400
+
+    try:
+        job_id = get_job_queue().submit(data, photo_bytes)
+    except Saturated as e:
+        return busy_response(e)
+    status = get_job_queue().status(job_id)
+    return status, 202, {'Location': f'/jobs/{job_id}'}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return "Unknown or expired job", 404
+    return status
+
+@app.route('/jobs/<job_id>/pdf')
+def job_pdf(job_id):
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return "Unknown or expired job", 404
+    if status['status'] != DONE:
+        return status, 409
+    pdf = get_job_queue().result(job_id)
+    if pdf is None:
+        return "Unknown or expired job", 404
+    return send_file(
+        BytesIO(pdf),
+        download_name='resume.pdf',
+        as_attachment=True,
+        mimetype='application/pdf'
+    )
+
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return "Expected a JSON array of resume records", 400
+    try:
+        for record in records:
+            Resume.from_data(record)
+    except (KeyError, ValueError) as e:
+        return f"Invalid resume record: {str(e)}", 400
+    try:
+        rendering = renderer()
+        profile = rendering.get_profile(request.args.get('output_profile'))
+        theme = rendering.get_theme(request.args.get('theme'))
+    except ValueError as e:
+        return str(e), 400
+
+    return Response(
+        iter_batch_zip(records, output_profile=profile.name, theme=theme.name),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=resumes.zip'}
+    )
+
+@app.route('/generate/book', methods=['POST'])
+def generate_book():
+    """
+    Renders a JSON array of resume records, as taken by /generate/batch,
+    into one PDF with an outline entry per candidate. The PDF is streamed
+    as it is written.
+    """
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return "Expected a JSON array of resume records", 400
+    try:
+        resumes = [Resume.from_data(record) for record in records]
+    except (KeyError, ValueError) as e:
+        return f"Invalid resume record: {str(e)}", 400
+    try:
+        rendering = renderer()
+        profile = rendering.get_profile(request.args.get('output_profile'))
+        theme = rendering.get_theme(request.args.get('theme'))
+    except ValueError as e:
+        return str(e), 400
+
+    try:
+        photos = [record_photo(record) for record in records]
+    except ValueError as e:
+        return f"Invalid resume record: {str(e)}", 400
+    try:
+        token = admit_render(None, cost=rendering.book_cost(photos))
+    except Saturated as e:
+        return busy_response(e)
+
+    def render(*args, **kwargs):
+        # Holds the slot until the whole book is written
+        try:
+            return rendering.create_book(*args, **kwargs)
+        finally:
+            render_scheduler.release(token)
+
+    registry.inc('book_requests_total')
+    return Response(
+        stream_render(render, zip(resumes, photos), output_profile=profile.name, theme=theme),
+        mimetype='application/pdf',
+        headers={'Content-Disposition': 'attachment; filename=resumes.pdf'},
+        direct_passthrough=True
+    )
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+from app import app as wsgi_app
+from streaming import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# uvicorn asgi:app
+#
+# Serves the Flask app over ASGI. Uploads are received and responses sent
+# by the event loop, and only the Flask request itself, parsing and
+# rendering, runs on a thread of the executor. A connection that is slow
+# to upload a photo or to read the PDF then costs a coroutine and a buffer,
+# not one of the executor's threads.
+
+# Request bodies beyond this size are spooled to a temporary file instead
+# of being kept in memory while the upload is in progress
+SPOOL_BYTES = 1024 * 1024
+
+# Chunks of a response read from the app ahead of the client, about 1 MB.
+# Beyond that the app waits for the client, so a large ZIP or book sent to
+# a slow client doesn't pile up in memory.
+READ_AHEAD_CHUNKS = 16
+
+def _file_wrapper(file, buffer_size=8192):
+    # send_file asks for 8 KB blocks; every block is a trip to the
+    # executor here, so read whole streaming chunks instead
+    return FileWrapper(file, CHUNK_SIZE)
+
+class AsgiBridge:
+    """
+    Minimal ASGI to WSGI bridge. The whole request body is received before
+    the WSGI app is called, and the response body is read from the app on
+    the executor, up to READ_AHEAD_CHUNKS ahead of what the client has
+    taken. A thread is only busy while the app produces a chunk, never
+    while the client is slow to take one.
+    """
+    def __init__(self, wsgi, executor=None, max_body=None):
+        self.wsgi = wsgi
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=int(os.environ['ASGI_THREADS']) if os.environ.get('ASGI_THREADS') else None,
+            thread_name_prefix='asgi',
+        )
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        received = await self._receive_body(scope, receive, send)
+        if received is None:
+            return
+        body, size = received
+        loop = asyncio.get_running_loop()
+        environ = self._environ(scope, body, size)
+        try:
+            status, headers, iterable, iterator, first = await loop.run_in_executor(
+                self.executor, self._start, environ
+            )
+        except Exception:
+            logger.exception("Error calling the WSGI app")
+            body.close()
+            await _plain_response(send, 500, b'Internal Server Error')
+            return
+
+        chunks = asyncio.Queue(READ_AHEAD_CHUNKS)
+        gone = asyncio.Event()
+        pump = loop.create_task(self._pump(iterable, iterator, first, chunks, gone))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, BaseException):
+                    # Like a WSGI server, end the response early; the
+                    # client sees a truncated body rather than a 500
+                    raise chunk
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except BaseException:
+            # Stops the pump, which may be waiting for room in the queue,
+            # and has it close the app's response
+            gone.set()
+            while not chunks.empty():
+                chunks.get_nowait()
+            raise
+        finally:
+            await pump
+            body.close()
+
+    async def _receive_body(self, scope, receive, send):
+        """
+        Receives the request body into a spooled temporary file and returns
+        it with its size, or None if the client disconnected, the
+        Content-Length header was malformed or the body was too large, in
+        which case the 400 or 413 has already been sent.
+        """
+        max_body = self.max_body if self.max_body is not None else self.wsgi.config.get('MAX_CONTENT_LENGTH')
+        for name, value in scope['headers']:
+            if name != b'content-length':
+                continue
+            try:
+                length = int(value)
+            except ValueError:
+                length = -1
+            if length < 0:
+                await _plain_response(send, 400, b'Bad Request')
+                return None
+            if max_body is not None and length > max_body:
+                await _plain_response(send, 413, b'Request Entity Too Large')
+                return None
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_body is not None and size > max_body:
+                body.close()
+                await _plain_response(send, 413, b'Request Entity Too Large')
+                return None
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body, size
+
+    def _environ(self, scope, body, size):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            # The body is complete, whatever the request said about its length
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _file_wrapper,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ',' + value
+            environ[name] = value
+        return environ
+
+    def _start(self, environ):
+        """
+        Calls the WSGI app and returns the status, the headers, the response
+        iterable, an iterator over it and its first chunk, which for some
+        apps is what makes them call start_response. Runs on the executor.
+        """
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        iterable = self.wsgi(environ, start_response)
+        iterator = iter(iterable)
+        try:
+            first = next(iterator, None)
+        except BaseException:
+            _close(iterable)
+            raise
+        status, headers = response
+        return status, headers, iterable, iterator, first
+
+    async def _pump(self, iterable, iterator, first, chunks, gone):
+        # Reads the rest of the WSGI response on the executor, chunk by
+        # chunk, and closes it. Ends the queue with None, or with the
+        # exception that cut the response short, unless the client is gone.
+        loop = asyncio.get_running_loop()
+        end = None
+        try:
+            chunk = first
+            while chunk is not None and not gone.is_set():
+                await chunks.put(chunk)
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+        except Exception as e:
+            end = e
+        finally:
+            await loop.run_in_executor(self.executor, _close, iterable)
+        if not gone.is_set():
+            await chunks.put(end)
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+async def _plain_response(send, status, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+app = AsgiBridge(wsgi_app)
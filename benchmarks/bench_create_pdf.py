@@ -0,0 +1,296 @@
+"""
+Benchmarks create_pdf and the /generate route on synthetic resumes.
+
+For every scenario it reports p50/p99 latency, PDFs per second per core on a
+process pool, peak RSS growth and output size, plus the output size with the
+compact output profile and how much smaller that is. Each scenario runs in a
+fresh process. It also times the /generate route, re-layout after a one
+entry edit with and without a layout session, and the cold start of a new
+process with and without lazy imports. Results go to stdout as JSON lines,
+and optionally to a JSON file that a later run can compare against.
+
+    python benchmarks/bench_create_pdf.py [--iterations 20] [--output before.json]
+    python benchmarks/bench_create_pdf.py --compare before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from bench_photo import make_upload, peak_rss_kb
+
+ABOUT = ("Engineer with a long track record of shipping reliable systems, "
+         "mentoring teams and turning vague requirements into working software. ")
+
+# name -> (experience entries, about repetitions, photo)
+SCENARIOS = {
+    'minimal': (1, 1, None),
+    'typical': (5, 3, ('JPEG', (1200, 1600))),
+    'long_about': (5, 40, None),
+    'exp_50': (50, 3, None),
+    'exp_200': (200, 3, None),
+    'photo_small_png': (5, 3, ('PNG', (200, 200))),
+    'photo_12mp_jpeg': (5, 3, ('JPEG', (4000, 3000))),
+}
+
+def make_resume(experience, about_repeat):
+    return {
+        'name': 'Jane Doe',
+        'title': 'Senior Software Engineer',
+        'about': ABOUT * about_repeat,
+        'phone': '+1 555 0100',
+        'email': 'jane.doe@example.com',
+        'address': '221B Baker Street, London',
+        'edu_years': ['2008 - 2012', '2012 - 2014'],
+        'edu_school': ['Massachusetts Institute of Technology', 'Stanford University'],
+        'edu_location': ['Cambridge, MA', 'Stanford, CA'],
+        'exp_years': [f'{2000 + i % 25} - {2001 + i % 25}' for i in range(experience)],
+        'exp_position': [f'Engineer, team {i}' for i in range(experience)],
+        'exp_description': ['Built and operated services handling millions of requests a day, '
+                            'cut latency and cost, and led a distributed team.'] * experience,
+        'skill_names': ['Python', 'Distributed systems', 'Leadership'],
+        'skill_levels': ['90', '75', '60'],
+    }
+
+def make_payload(scenario):
+    experience, about_repeat, photo = SCENARIOS[scenario]
+    photo_bytes = make_upload(*photo) if photo else None
+    return make_resume(experience, about_repeat), photo_bytes
+
+def render_once(data, photo_bytes, output_profile=None):
+    import photo
+    import rendering
+
+    # Forget processed photos so every iteration pays for the photo path
+    photo.photo_cache.clear()
+    photo_file = BytesIO(photo_bytes) if photo_bytes else None
+    return rendering.create_pdf(data, photo_file, output_profile=output_profile).getvalue()
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def latency_stats(timings):
+    return {
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+    }
+
+def measure_latency(data, photo_bytes, iterations, results):
+    # Runs in a fresh process so peak RSS belongs to this scenario alone.
+    # The payload is generated by the parent, and the baseline is taken after
+    # the imports, before the first render.
+    import app  # noqa: F401
+
+    before = peak_rss_kb()
+    render_once(data, photo_bytes)  # warm up metric caches
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        pdf = render_once(data, photo_bytes)
+        timings.append(time.perf_counter() - start)
+    row = latency_stats(timings)
+    row['peak_rss_kb'] = peak_rss_kb()
+    row['peak_rss_delta_kb'] = row['peak_rss_kb'] - before
+    row['output_bytes'] = len(pdf)
+    row['compact_output_bytes'] = len(render_once(data, photo_bytes, 'compact'))
+    row['compact_reduction_pct'] = round(100 * (1 - row['compact_output_bytes'] / len(pdf)), 1)
+    results.put(row)
+
+_payload = None
+
+def _init_worker(scenario):
+    global _payload
+    _payload = make_payload(scenario)
+    render_once(*_payload)
+
+def _render_payload(_):
+    render_once(*_payload)
+
+def measure_throughput(scenario, iterations):
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(scenario,)) as pool:
+        list(pool.map(_render_payload, range(workers)))  # wait until every worker is up
+        count = iterations * workers
+        start = time.perf_counter()
+        list(pool.map(_render_payload, range(count)))
+        elapsed = time.perf_counter() - start
+    return {'pdfs_per_sec_per_core': round(count / elapsed / workers, 1), 'workers': workers}
+
+def measure_route(iterations):
+    """
+    Posts the typical form to /generate through the Flask test client, with
+    the render cache disabled and with every request hitting it
+    """
+    import app
+    import photo
+    from render_cache import RenderCache
+
+    data, photo_bytes = make_payload('typical')
+    form = {k: v for k, v in data.items() if isinstance(v, str)}
+    form.update({k + '[]': v for k, v in data.items() if isinstance(v, list)})
+    client = app.app.test_client()
+
+    def post(uncached):
+        if uncached:
+            photo.photo_cache.clear()
+        fields = dict(form, photo=(BytesIO(photo_bytes), 'photo.jpg'))
+        start = time.perf_counter()
+        response = client.post('/generate', data=fields)
+        response.close()
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    rows = []
+    for label, uncached in (('route_uncached', True), ('route_cached', False)):
+        app.render_cache = RenderCache(max_entries=0 if uncached else 128)
+        post(uncached)
+        timings = [post(uncached) for _ in range(iterations)]
+        rows.append(dict(scenario=label, **latency_stats(timings)))
+    return rows
+
+def measure_incremental(iterations):
+    """
+    Lays out the exp_200 resume again after editing one experience entry,
+    from scratch and through a LayoutSession that reuses unchanged sections
+    """
+    from incremental import LayoutSession
+    from layout import layout_resume
+
+    data, _ = make_payload('exp_200')
+
+    def edited(i):
+        descriptions = list(data['exp_description'])
+        descriptions[len(descriptions) // 2] += ' edited' * (i + 1)
+        return dict(data, exp_description=descriptions)
+
+    session = LayoutSession()
+    session.layout(data)
+    rows = []
+    for label, layout in (('edit_full_layout', layout_resume), ('edit_incremental_layout', session.layout)):
+        timings = []
+        for i in range(iterations):
+            edit = edited(i)
+            start = time.perf_counter()
+            layout(edit)
+            timings.append(time.perf_counter() - start)
+        rows.append(dict(scenario=label, **latency_stats(timings)))
+    return rows
+
+# Run by a fresh interpreter for each cold start measurement, so nothing is
+# imported before app. The form fields come in on stdin.
+COLD_START = """
+import json, sys, time
+from io import BytesIO
+form = json.load(sys.stdin)
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/').close()
+form_page = time.perf_counter()
+response = client.post('/generate', data=form)
+assert response.status_code == 200, response.status_code
+response.close()
+generated = time.perf_counter()
+response = client.post('/generate', data=dict(form, name='Someone Else'))
+response.close()
+print(json.dumps({
+    'import_ms': round((imported - start) * 1000, 2),
+    'first_form_page_ms': round((form_page - imported) * 1000, 2),
+    'first_generate_ms': round((generated - form_page) * 1000, 2),
+    'second_generate_ms': round((time.perf_counter() - generated) * 1000, 2),
+}))
+"""
+
+def measure_cold_start():
+    """
+    Times importing app, the first form page and the first two /generate
+    requests in a new interpreter, with rendering imported and warmed up
+    at startup and with it imported lazily as on serverless platforms
+    """
+    data, _ = make_payload('typical')
+    form = {k: v for k, v in data.items() if isinstance(v, str)}
+    form.update({k + '[]': v for k, v in data.items() if isinstance(v, list)})
+    rows = []
+    for label, lazy in (('cold_start_eager', '0'), ('cold_start_lazy', '1')):
+        env = dict(os.environ, PDF_LAZY_IMPORTS=lazy)
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START], input=json.dumps(form), env=env, cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout
+        rows.append(dict(scenario=label, **json.loads(output)))
+    return rows
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {row['scenario']: row for row in json.load(f)['results']}
+    for row in current:
+        old = baseline.get(row['scenario'])
+        if not old:
+            continue
+        changes = {
+            key: round(row[key] / old[key], 2)
+            for key in ('p50_ms', 'p99_ms', 'pdfs_per_sec_per_core', 'peak_rss_delta_kb', 'output_bytes',
+                        'compact_output_bytes', 'import_ms', 'first_form_page_ms', 'first_generate_ms')
+            if row.get(key) and old.get(key)
+        }
+        print(json.dumps({'scenario': row['scenario'], 'ratio_vs_baseline': changes}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='run only these scenarios (repeatable)')
+    parser.add_argument('--skip-throughput', action='store_true')
+    parser.add_argument('--output', help='write all results to this JSON file')
+    parser.add_argument('--compare', help='print ratios against a previous --output file')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        queue = ctx.Queue()
+        data, photo_bytes = make_payload(scenario)
+        proc = ctx.Process(target=measure_latency, args=(data, photo_bytes, args.iterations, queue))
+        proc.start()
+        row = dict(scenario=scenario, **queue.get())
+        proc.join()
+        if not args.skip_throughput:
+            row.update(measure_throughput(scenario, max(1, args.iterations // 4)))
+        results.append(row)
+        print(json.dumps(row), flush=True)
+
+    for row in measure_route(args.iterations) + measure_incremental(args.iterations) + measure_cold_start():
+        results.append(row)
+        print(json.dumps(row), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'iterations': args.iterations,
+                'results': results,
+            }, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
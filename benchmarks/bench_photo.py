@@ -0,0 +1,107 @@
+"""
+Compares the photo preprocessing stage against the original full-decode
+LANCZOS path on synthetic uploads. Each run happens in a fresh process so
+peak RSS is measured per pipeline. Prints one JSON object per scenario.
+
+    python benchmarks/bench_photo.py [--repeat 5]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image
+
+import photo
+
+TARGET_SIZE = 158
+
+SCENARIOS = {
+    'png_400x400': ('PNG', (400, 400)),
+    'jpeg_2mp': ('JPEG', (1600, 1200)),
+    'jpeg_12mp': ('JPEG', (4000, 3000)),
+    'png_12mp': ('PNG', (4000, 3000)),
+}
+
+def make_upload(fmt, size):
+    # Gradient plus noise, so the encoders don't get an unrealistically easy image
+    noise = Image.effect_noise(size, 40)
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+def legacy_pipeline(photo_bytes, size):
+    # What create_pdf did before: decode everything, then one LANCZOS pass
+    img = Image.open(BytesIO(photo_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img.resize((size, size), Image.Resampling.LANCZOS)
+
+def draft_pipeline(photo_bytes, size):
+    return photo.preprocess_photo(Image.open(BytesIO(photo_bytes)), size)
+
+PIPELINES = {'legacy': legacy_pipeline, 'draft': draft_pipeline}
+
+def peak_rss_kb():
+    # ru_maxrss survives fork+exec on Linux, so a spawned child would report
+    # the parent's peak. VmHWM belongs to the new address space.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(pipeline, path, repeat, results):
+    func = PIPELINES[pipeline]
+    with open(path, 'rb') as f:
+        photo_bytes = f.read()
+    before = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(photo_bytes, TARGET_SIZE)
+        timings.append(time.perf_counter() - start)
+    after = peak_rss_kb()
+    timings.sort()
+    results.put({
+        'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+        'peak_rss_delta_kb': after - before,
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    for scenario, (fmt, size) in SCENARIOS.items():
+        photo_bytes = make_upload(fmt, size)
+        row = {'scenario': scenario, 'upload_bytes': len(photo_bytes)}
+        # Children read the upload from disk so generating it doesn't count
+        # towards their peak RSS
+        with tempfile.NamedTemporaryFile(suffix='.' + fmt.lower()) as upload:
+            upload.write(photo_bytes)
+            upload.flush()
+            for pipeline in PIPELINES:
+                results = ctx.Queue()
+                proc = ctx.Process(target=run, args=(pipeline, upload.name, args.repeat, results))
+                proc.start()
+                row[pipeline] = results.get()
+                proc.join()
+        row['speedup'] = round(row['legacy']['median_ms'] / max(row['draft']['median_ms'], 0.01), 1)
+        print(json.dumps(row), flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+
+from werkzeug.utils import secure_filename
+
+import rendering
+from resume import LIST_FIELDS, as_resume, decode_photo
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Inputs are read in two steps: a reader yields the raw entries of a file,
+# lines or CSV rows, and a parser turns one of them into a record, raising
+# ValueError if it can't. A bad entry then fails on its own instead of
+# ending the run.
+
+def read_jsonl(path):
+    """
+    Yields the lines of a JSON Lines file, skipping blank ones
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+def parse_jsonl(line):
+    """
+    A JSON object in any form as_resume takes
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object")
+    return record
+
+def read_csv(path):
+    """
+    Yields the rows of a CSV file with a header row naming the fields of a
+    batch record
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+def parse_csv(row):
+    """
+    A batch record from a CSV row. The list fields hold JSON arrays, e.g.
+    ["2010", "2014"].
+    """
+    record = dict(row)
+    for field in LIST_FIELDS:
+        value = record.get(field)
+        record[field] = json.loads(value) if value else []
+        if not isinstance(record[field], list):
+            raise ValueError(f"Field '{field}' must be a JSON array")
+    return record
+
+READERS = {
+    '.jsonl': (read_jsonl, parse_jsonl),
+    '.ndjson': (read_jsonl, parse_jsonl),
+    '.csv': (read_csv, parse_csv),
+}
+
+def get_reader(path):
+    """
+    The reader and parser for the input's format
+    """
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f"Unsupported input {path}, expected one of {', '.join(READERS)}")
+    return reader
+
+def count_records(path):
+    """
+    Number of records in the input, for the ETA. Counted without parsing
+    the JSON.
+    """
+    if get_reader(path)[0] is read_csv:
+        with open(path, encoding='utf-8', newline='') as f:
+            return sum(1 for _ in csv.DictReader(f))
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+def record_id(record, index):
+    """
+    The record's own id if it has one, else its position in the input
+    """
+    value = record.get('id')
+    return str(value) if value not in (None, '') else f"{index:08d}"
+
+def output_path(out_dir, rid):
+    """
+    Where the PDF of a record goes: two levels of directories named after
+    the id's hash, so no directory ends up with more than a few hundred
+    files however large the export
+    """
+    digest = hashlib.sha1(rid.encode('utf-8')).hexdigest()
+    name = secure_filename(rid) or digest
+    return os.path.join(out_dir, digest[:2], digest[2:4], f"{name}.pdf")
+
+def render_to_file(resume, photo_bytes, photo_path, path, output_profile=None, theme=None, invariant=None):
+    """
+    Renders one resume to path, through a temporary file in the same
+    directory that is renamed into place, so path either doesn't exist or
+    holds a complete PDF. Runs in the worker processes.
+    """
+    if photo_path is not None:
+        with open(photo_path, 'rb') as f:
+            photo_bytes = f.read()
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            photo = BytesIO(photo_bytes) if photo_bytes else None
+            rendering.create_pdf(resume, photo, out=f, output_profile=output_profile, theme=theme, invariant=invariant)
+            size = f.tell()
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return size
+
+class Checkpoint:
+    """
+    Append-only file of the ids of the records that are done, one per line.
+    A line is written only once its PDF is in place, and a last line cut
+    short by a crash is ignored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        self.done.add(line[:-1])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __contains__(self, rid):
+        return rid in self.done
+
+    def add(self, rid):
+        self.done.add(rid)
+        self._file.write(rid + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+class Progress:
+    """
+    Prints throughput and ETA to stderr every PROGRESS_INTERVAL seconds
+    """
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self._last = self.start
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.done - self.failed - self.skipped
+        eta = format_duration(remaining / rate) if rate else '?'
+        print(
+            f"{self.done + self.skipped}/{self.total} done ({self.skipped} skipped), {self.failed} failed, "
+            f"{rate:.1f} resumes/s, {self.bytes / 1048576:.1f} MB, elapsed {format_duration(elapsed)}, ETA {eta}",
+            file=self.stream, flush=True,
+        )
+
+def prepare(record, base_dir):
+    """
+    Returns the Resume, photo bytes and photo path of a record. Photos
+    are either base64 in 'photo', as in batch records, or a file named by
+    'photo_path', relative to the input file.
+    """
+    resume = as_resume(record)
+    photo_bytes = decode_photo(record['photo']) if record.get('photo') else None
+    photo_path = None
+    if record.get('photo_path'):
+        photo_path = os.path.join(base_dir, record['photo_path'])
+    return resume, photo_bytes, photo_path
+
+def render_all(input_path, out_dir, workers=None, checkpoint_path=None, output_profile=None, theme=None,
+               invariant=None, progress_stream=sys.stderr):
+    """
+    Renders every record of a JSONL or CSV export into out_dir on a pool of
+    worker processes, skipping the ones listed in the checkpoint (by
+    default out_dir/checkpoint.txt) and adding the ones it finishes.
+    Returns the Progress with the final counts.
+    """
+    workers = workers or os.cpu_count() or 1
+    read, parse = get_reader(input_path)
+    # Resolved here, so bad names fail before anything is rendered
+    output_profile = rendering.get_profile(output_profile).name
+    theme = rendering.get_theme(theme).name
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(out_dir, 'checkpoint.txt'))
+    progress = Progress(count_records(input_path), progress_stream)
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    # Enough work queued to keep every worker busy, without reading the
+    # whole export into memory
+    window = workers * 4
+    pending = {}
+    # Every id met in this run. A second record with the same id would
+    # overwrite the first one's PDF, so it fails instead.
+    seen = set()
+
+    def collect(futures):
+        for future in futures:
+            rid = pending.pop(future)
+            try:
+                progress.bytes += future.result()
+            except Exception as e:
+                progress.failed += 1
+                logger.error("Record %s failed: %s", rid, e)
+            else:
+                progress.done += 1
+                checkpoint.add(rid)
+        progress.report()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            try:
+                for index, entry in enumerate(read(input_path)):
+                    rid = f"{index:08d}"
+                    try:
+                        record = parse(entry)
+                        rid = record_id(record, index)
+                        if rid in seen:
+                            raise ValueError("Duplicate id")
+                        seen.add(rid)
+                        if rid in checkpoint:
+                            progress.skipped += 1
+                            continue
+                        resume, photo_bytes, photo_path = prepare(record, base_dir)
+                    except Exception as e:
+                        progress.failed += 1
+                        logger.error("Record %s is invalid: %s", rid, e)
+                        continue
+                    future = executor.submit(
+                        render_to_file, resume, photo_bytes, photo_path, output_path(out_dir, rid),
+                        output_profile, theme, invariant,
+                    )
+                    pending[future] = rid
+                    if len(pending) >= window:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            finally:
+                # Records already rendered are checkpointed even if reading
+                # the input failed half way
+                collect(list(pending))
+    finally:
+        checkpoint.close()
+    progress.report(force=True)
+    return progress
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Render a JSONL or CSV export of resumes to PDF files')
+    parser.add_argument('input', help='.jsonl or .csv file of resume records')
+    parser.add_argument('out', help='directory for the PDFs, sharded by the hash of each record id')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: OUT/checkpoint.txt)')
+    parser.add_argument('--output-profile', default=None)
+    parser.add_argument('--theme', default=None)
+    parser.add_argument('--invariant', action='store_true', default=None,
+                        help='byte for byte reproducible PDFs (default: PDF_INVARIANT)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    result = render_all(
+        args.input, args.out, args.workers, args.checkpoint, args.output_profile, args.theme, args.invariant
+    )
+    sys.exit(1 if result.failed else 0)
@@ -0,0 +1,23 @@
+import gc
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master, which also imports and warms up
+# rendering (see LAZY_IMPORTS in app.py), and the workers are forked from
+# it. Imported modules, fonts, compiled themes and warm caches then live in
+# memory pages shared by all workers until one of them writes to a page.
+# The garbage collector would write to every object it tracks, so it is
+# kept off in the master until the app is loaded, the loaded objects are
+# frozen out of its reach before forking, and each worker turns it back on.
+gc.disable()
+
+bind = os.environ.get('BIND', '0.0.0.0:' + os.environ.get('PORT', '8000'))
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+preload_app = True
+
+def when_ready(server):
+    gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from layout import layout_resume
+from metrics import registry
+
+class LayoutSession:
+    """
+    Lays out successive versions of one resume, e.g. while it is being
+    edited, reusing every section (header, about, contact, each skill, each
+    education and experience entry) whose inputs are unchanged since the
+    previous layout. Sections are keyed by their inputs, including the
+    theme, so switching themes within a session is safe. Only sections of
+    the latest layout are kept.
+    """
+    def __init__(self):
+        self._sections = {}
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def layout(self, data, photo=None, theme=None):
+        with self._lock:
+            self.last_used = time.monotonic()
+            previous = self._sections
+            current = {}
+            reused = 0
+
+            def section(fn, *args):
+                nonlocal reused
+                key = (fn.__name__,) + args
+                result = current.get(key)
+                if result is None:
+                    result = previous.get(key)
+                    if result is None:
+                        result = fn(*args)
+                    else:
+                        reused += 1
+                    current[key] = result
+                return result
+
+            resume = layout_resume(data, photo, theme, section)
+            self._sections = current
+
+        registry.inc('layout_sections_reused_total', reused)
+        registry.inc('layout_sections_total', len(current))
+        return resume
+
+class LayoutSessions:
+    """
+    LayoutSessions by client supplied id, dropping the least recently used
+    beyond max_sessions and any idle for longer than ttl seconds
+    """
+    def __init__(self, max_sessions=1024, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.last_used + self.ttl < now:
+                session = self._sessions[session_id] = LayoutSession()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            # The oldest sessions come first, expire them from the front
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest.last_used + self.ttl >= now:
+                    break
+                self._sessions.popitem(last=False)
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
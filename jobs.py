@@ -0,0 +1,335 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from admission import Saturated
+from render_cache import cache_key
+from resume import Resume, as_resume
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobQueue:
+    """
+    Interface for the render job queues behind /jobs. Jobs are identified by
+    an opaque id; submitting the same inputs again while a job for them is
+    queued, running or finished returns the existing id.
+    """
+    def submit(self, data, photo_bytes=None):
+        raise NotImplementedError
+
+    def status(self, job_id):
+        """
+        Returns a dict with id, status, created, finished and error, or None
+        for unknown and expired jobs
+        """
+        raise NotImplementedError
+
+    def result(self, job_id):
+        """
+        Returns the PDF bytes of a finished job, or None
+        """
+        raise NotImplementedError
+
+def error_message(error):
+    """
+    What a failed job reports, never empty: str() of some exceptions is
+    """
+    return str(error) or type(error).__name__
+
+def failed_future(error):
+    """
+    A future that has already failed with error
+    """
+    future = Future()
+    future.set_exception(error)
+    return future
+
+class _Job:
+    __slots__ = ('id', 'key', 'status', 'created', 'finished', 'error', 'result', 'future')
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+        self.result = None
+        self.future = None
+
+    def to_dict(self):
+        status = self.status
+        if status == QUEUED and self.future is not None and self.future.running():
+            status = RUNNING
+        return {
+            'id': self.id,
+            'status': status,
+            'created': self.created,
+            'finished': self.finished,
+            'error': self.error,
+        }
+
+class ExecutorJobQueue(JobQueue):
+    """
+    Keeps jobs in memory and renders them on a concurrent.futures executor,
+    either a thread pool or a process pool. render(data, photo_bytes) must be
+    a module level function so process pools can pickle it.
+    replace_executor(broken) returns a fresh process pool in place of one
+    broken by a worker that died.
+
+    Queued jobs hold their photo and finished ones their PDF, in memory, so
+    at most max_pending jobs may be queued or running, beyond which submit
+    raises Saturated, and finished PDFs past max_result_bytes are dropped
+    oldest first, as if they had expired.
+    """
+    # Seconds a client is asked to wait when the queue is full
+    retry_after = 5
+
+    def __init__(self, executor, render, ttl=3600, replace_executor=None,
+                 max_pending=64, max_result_bytes=256 * 1024 * 1024):
+        self.executor = executor
+        self.render = render
+        self.replace_executor = replace_executor
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.max_result_bytes = max_result_bytes
+        self._jobs = {}
+        self._by_key = {}
+        self._pending = 0
+        self._result_bytes = 0
+        self._lock = threading.Lock()
+        self._last_expiry = 0
+
+    def submit(self, data, photo_bytes=None):
+        key = cache_key(data, photo_bytes)
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(self._by_key.get(key))
+            if job is not None and job.status != FAILED:
+                return job.id
+            if self._pending >= self.max_pending:
+                raise Saturated("Too many jobs queued", self.retry_after)
+            self._pending += 1
+            job = _Job(key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        try:
+            job.future = self._submit(data, photo_bytes)
+        except Exception as e:
+            job.future = failed_future(e)
+        job.future.add_done_callback(lambda f: self._finish(job, f))
+        return job.id
+
+    def _submit(self, data, photo_bytes):
+        try:
+            return self.executor.submit(self.render, data, photo_bytes)
+        except BrokenProcessPool:
+            if self.replace_executor is None:
+                raise
+            self.executor = self.replace_executor(self.executor)
+            return self.executor.submit(self.render, data, photo_bytes)
+
+    def _finish(self, job, future):
+        with self._lock:
+            self._pending -= 1
+            job.future = None
+            error = future.exception()
+            if error is not None:
+                job.status = FAILED
+                job.error = error_message(error)
+            else:
+                job.status = DONE
+                job.result = future.result()
+                self._result_bytes += len(job.result)
+            job.finished = time.time()
+            if self._result_bytes > self.max_result_bytes:
+                # Oldest first, which is the order jobs were added in
+                for old in [j for j in self._jobs.values() if j.result is not None]:
+                    if self._result_bytes <= self.max_result_bytes:
+                        break
+                    self._drop(old)
+
+    def status(self, job_id):
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.result if job is not None else None
+
+    def _expire(self):
+        # Called with the lock held, at most once a second
+        now = time.time()
+        if now - self._last_expiry < 1:
+            return
+        self._last_expiry = now
+        expired = [job for job in self._jobs.values()
+                   if job.finished is not None and job.finished + self.ttl < now]
+        for job in expired:
+            self._drop(job)
+
+    def _drop(self, job):
+        # Called with the lock held
+        del self._jobs[job.id]
+        if self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+        if job.result is not None:
+            self._result_bytes -= len(job.result)
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue stored in a local SQLite database. Jobs are rendered by
+    run_worker loops, either on threads started here (workers=N) or in
+    separate processes started with `python jobs.py worker --db PATH`.
+    """
+    # Running jobs not finished after this many seconds are assumed to belong
+    # to a crashed worker and are handed out again
+    stale_after = 300
+
+    def __init__(self, path, render=None, ttl=3600, workers=0):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    data TEXT NOT NULL,
+                    photo BLOB,
+                    result BLOB,
+                    error TEXT
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+
+        for _ in range(workers):
+            threading.Thread(target=run_worker, args=(self, render), daemon=True).start()
+
+    def _connect(self):
+        # One short lived connection per call keeps this safe across threads
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Closing(conn)
+
+    def submit(self, data, photo_bytes=None):
+        key = cache_key(data, photo_bytes)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?', (now - self.ttl,))
+            row = conn.execute(
+                'SELECT id FROM jobs WHERE key = ? AND status != ? ORDER BY created DESC LIMIT 1',
+                (key, FAILED)
+            ).fetchone()
+            if row is not None:
+                conn.execute('COMMIT')
+                return row['id']
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, key, status, created, data, photo) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, key, QUEUED, now, as_resume(data).to_json().decode('utf-8'), photo_bytes)
+            )
+            conn.execute('COMMIT')
+        return job_id
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, created, finished, error FROM jobs WHERE id = ? AND (finished IS NULL OR finished >= ?)',
+                (job_id, time.time() - self.ttl)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def result(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT result FROM jobs WHERE id = ? AND status = ? AND finished >= ?',
+                (job_id, DONE, time.time() - self.ttl)
+            ).fetchone()
+        return row['result'] if row is not None else None
+
+    def claim(self):
+        """
+        Marks the oldest queued job as running and returns (id, resume,
+        photo_bytes), or None when there is nothing to do
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, data, photo FROM jobs WHERE status = ? OR (status = ? AND started < ?) '
+                'ORDER BY created LIMIT 1',
+                (QUEUED, RUNNING, now - self.stale_after)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE jobs SET status = ?, started = ? WHERE id = ?', (RUNNING, now, row['id']))
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        return row['id'], Resume.from_json(row['data']), row['photo']
+
+    def complete(self, job_id, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished = ?, result = ?, error = ?, photo = NULL WHERE id = ?',
+                (FAILED if error is not None else DONE, time.time(), result, error, job_id)
+            )
+
+class _Closing:
+    # sqlite3 connections only end transactions on exit, this also closes them
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+def run_worker(queue, render, stop=None, poll_interval=0.5):
+    """
+    Renders jobs from a SQLiteJobQueue until stop (a threading.Event) is set
+    """
+    while stop is None or not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        job_id, data, photo_bytes = job
+        try:
+            queue.complete(job_id, result=render(data, photo_bytes))
+        except Exception as e:
+            logger.exception("Error rendering job %s", job_id)
+            queue.complete(job_id, error=error_message(e))
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Render queued PDF jobs from a SQLite job database')
+    parser.add_argument('command', choices=['worker'])
+    parser.add_argument('--db', default=os.environ.get('JOB_DB', 'jobs.sqlite3'))
+    args = parser.parse_args()
+
+    from app import render_pdf_bytes
+    run_worker(SQLiteJobQueue(args.db), render_pdf_bytes)
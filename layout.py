@@ -0,0 +1,403 @@
+import time
+from collections import namedtuple
+
+from metrics import observe
+from photo import draw_photo
+from resume import as_resume
+from text_layout import layout_text, text_width
+from themes import get_theme
+
+# A run of content that is never split across pages. Ops are drawing
+# commands whose y offsets (dy) are measured down from the block's origin:
+#   ('text', x, dy, text, font_name, font_size, color)   dy to the baseline
+#   ('rect', x, dy, width, height, color)                dy to the bottom edge
+#   ('circle', x, dy, radius, color)                     dy to the centre
+#   ('image', x, dy, width, height, photo)               dy to the bottom edge
+#   ('form', name, ops)                                  see below
+# Nothing in them is specific to PDF except the photo, which is whatever the
+# output backend loaded it as: an XObject for PDF, a PIL image otherwise.
+# space_before is dropped when the block starts a page, and keep_with_next
+# moves the block to the next page together with the one that follows it.
+Block = namedtuple('Block', 'height ops space_before keep_with_next')
+Block.__new__.__defaults__ = (0, False)
+
+# Forms are the parts of a theme that look the same on every resume. Their
+# ops are compiled once per process with the theme; each document draws
+# them once into a form XObject that every page showing them references.
+# dy is measured from the top edge, and a form is always the first thing
+# drawn on its page. In a PDF of one resume a form is only kept where it
+# makes the file smaller, see inline_forms.
+
+# Rough sizes in bytes, measured with the default output profile: the
+# overhead of a form XObject, of each page's reference to it, and of an
+# op drawn directly on a page. Text ops are larger, so forms of text are
+# kept a little less often than would pay off.
+FORM_BYTES = 600
+FORM_USE_BYTES = 70
+OP_BYTES = 20
+
+# Everything needed to draw a resume: the theme it was laid out with,
+# absolute ops for the first page (background, header text and photo) and
+# the blocks of each of the theme's columns
+ResumeLayout = namedtuple('ResumeLayout', 'theme first_page columns')
+
+def text_blocks(text, x, width, font_name, font_size, color, leading=None):
+    """
+    One block per wrapped line, so long paragraphs can flow onto the next page
+    """
+    return [
+        Block(line.height, (('text', x, 0, line.text, font_name, font_size, color),))
+        for line in layout_text(text, width, font_name, font_size, leading)
+    ]
+
+def heading_block(column, text, space_before=0):
+    return Block(
+        column.heading_height,
+        (('text', column.x, 0, text) + column.heading,),
+        space_before,
+        keep_with_next=True,
+    )
+
+def chain(blocks):
+    """
+    Marks all but the last block to stay with the next, keeping an entry on
+    one page whenever it fits on one
+    """
+    return [block._replace(keep_with_next=True) for block in blocks[:-1]] + blocks[-1:]
+
+def stack(parts):
+    """
+    Joins several line lists into one block, e.g. a skill name and its bar
+    """
+    ops = []
+    height = 0
+    for part_height, part_ops in parts:
+        ops.extend(op[:2] + (op[2] + height,) + op[3:] for op in part_ops)
+        height += part_height
+    return Block(height, tuple(ops))
+
+def _call(fn, *args):
+    return fn(*args)
+
+# Sections are laid out independently of each other from their own inputs,
+# so a LayoutSession can reuse the ones that didn't change. The layout_*
+# functions below take a section(fn, *args) callable that returns
+# fn(*args), possibly from a cache; the results must not be modified.
+# Columns and themes are compiled once per process, so they can be part of
+# the arguments.
+
+def column_text(column, text, style=None):
+    return text_blocks(text, column.x, column.width, *(style or column.text))
+
+def layout_about(column, about):
+    return column_text(column, about)
+
+def layout_contact(column, phone, email, address):
+    blocks = []
+    for text in (phone, email, address):
+        blocks.extend(column_text(column, text))
+    return blocks
+
+def layout_skill(column, name, level):
+    """
+    A skill name with its bar, in one block
+    """
+    bar = column.skill_bar
+    lines = column_text(column, name)
+    level_width = level / 100 * bar.width
+    ops = (
+        ('rect', column.x, bar.top, bar.width, bar.height, bar.track),
+        ('rect', column.x, bar.top, level_width, bar.height, bar.fill),
+    )
+    return stack([(b.height, b.ops) for b in lines] + [(bar.space, ops)])
+
+def timeline_entry(column, heading, lines, space_before):
+    """
+    Blocks for one education or experience entry: a heading, with a dot if
+    the column has a timeline, followed by regular lines of detail
+    """
+    blocks = column_text(column, heading, column.entry_heading)
+    for text in lines:
+        blocks.extend(column_text(column, text))
+    if not blocks:
+        blocks = [Block(0, ())]
+
+    first = blocks[0]
+    ops = first.ops
+    dot = column.timeline
+    if dot is not None:
+        ops = (('circle', column.x + dot.dx, dot.dy, dot.radius, dot.color),) + ops
+    blocks[0] = first._replace(ops=ops, space_before=space_before)
+    return chain(blocks)
+
+def layout_education(column, years, school, location, first):
+    return timeline_entry(column, years, (school, location), 0 if first else column.entry_space)
+
+def layout_experience(column, years, position, description, first):
+    return timeline_entry(column, years, (position, description), 0 if first else column.entry_space)
+
+def _about(column, resume, section):
+    return section(layout_about, column, resume.about)
+
+def _contact(column, resume, section):
+    return section(layout_contact, column, resume.phone, resume.email, resume.address)
+
+def _skills(column, resume, section):
+    return [section(layout_skill, column, skill.name, skill.level) for skill in resume.skills]
+
+def _education(column, resume, section):
+    blocks = []
+    for i, entry in enumerate(resume.education):
+        blocks.extend(section(layout_education, column, entry.years, entry.school, entry.location, i == 0))
+    return blocks
+
+def _experience(column, resume, section):
+    blocks = []
+    for i, entry in enumerate(resume.experience):
+        blocks.extend(section(layout_experience, column, entry.years, entry.position, entry.description, i == 0))
+    return blocks
+
+# Content of each section a theme can place in a column, under its heading
+SECTIONS = {
+    'about': _about,
+    'contact': _contact,
+    'skills': _skills,
+    'education': _education,
+    'experience': _experience,
+}
+
+def layout_column(column, resume, section=_call):
+    """
+    Blocks of one column: its sections in the theme's order, each under its
+    heading. A section that follows one with entries gets the space after
+    an entry on top of the space between sections.
+    """
+    blocks = []
+    content = None
+    for name in column.sections:
+        if content is None:
+            # The first heading is part of the first page form
+            blocks.append(Block(column.heading_height, (), keep_with_next=True))
+        else:
+            space = column.section_space + (column.entry_space if content else 0)
+            blocks.append(heading_block(column, column.headings[name], space))
+        content = SECTIONS[name](column, resume, section)
+        blocks.extend(content)
+    return blocks
+
+def layout_header(theme, name, title):
+    """
+    Name and title centred in the header
+    """
+    ops = []
+    for text_words, (top, style) in ((name, theme.header.name), (title, theme.header.title)):
+        text = ' '.join(text_words)
+        x = theme.header.center - text_width(text, style.font, style.size) / 2
+        ops.append(('text', x, top, text) + style)
+    return tuple(ops)
+
+def layout_first_page(theme, resume, photo=None, section=_call):
+    """
+    Absolute ops for the background, header and photo of the first page,
+    with dy measured from the top edge
+    """
+    # Background, with a placeholder in place of a missing photo
+    if photo is not None:
+        x, top, size = theme.photo
+        ops = (theme.first_page, ('image', x, size + top, size, size, photo))
+    else:
+        ops = (theme.first_page_placeholder,)
+    return ops + section(layout_header, theme, resume.name, resume.title)
+
+def layout_resume(data, photo=None, theme=None, section=_call):
+    """
+    Layout pass: measures every block of the resume once, before any
+    drawing. data is a Resume or anything as_resume takes, theme a compiled
+    Theme or the name of one, None meaning the default theme.
+    """
+    resume = as_resume(data)
+    theme = get_theme(theme)
+    return ResumeLayout(
+        theme,
+        layout_first_page(theme, resume, photo, section),
+        tuple(layout_column(column, resume, section) for column in theme.columns),
+    )
+
+def paginate(blocks, first_top, top, bottom):
+    """
+    Assigns each block a page and the y position of its origin. Returns a
+    list of (page, y, block) in order.
+    """
+    placements = []
+    page = 0
+    y = first_top
+    at_top = True
+    i = 0
+
+    while i < len(blocks):
+        # Blocks chained with keep_with_next move to a new page together
+        j = i
+        while j < len(blocks) - 1 and blocks[j].keep_with_next:
+            j += 1
+        group = blocks[i:j + 1]
+        group_height = sum(b.space_before + b.height for b in group)
+
+        fits = y - group_height >= bottom
+        if not fits and not at_top and top - group_height + group[0].space_before >= bottom:
+            page, y, at_top = page + 1, top, True
+            fits = True
+
+        for block in group:
+            # A group taller than a page flows block by block
+            if not fits and not at_top and y - block.space_before - block.height < bottom:
+                page, y, at_top = page + 1, top, True
+            if not at_top:
+                y -= block.space_before
+            placements.append((page, y, block))
+            y -= block.height
+            at_top = False
+        i = j + 1
+
+    return placements
+
+def form_pays_off(form_ops, uses):
+    """
+    Whether a form of form_ops drawn on uses pages gives a smaller PDF than
+    drawing the ops on each of those pages
+    """
+    return uses * (OP_BYTES * len(form_ops) - FORM_USE_BYTES) > FORM_BYTES
+
+def inline_forms(ops, uses):
+    """
+    ops with the forms that don't pay off on uses pages replaced by the ops
+    they are made of
+    """
+    return tuple(
+        inner
+        for op in ops
+        for inner in (op[2] if op[0] == 'form' and not form_pays_off(op[2], uses) else (op,))
+    )
+
+class CanvasPainter:
+    """
+    Draws ops onto a ReportLab canvas, skipping font and colour changes that
+    would not change anything. shared_forms keeps every form as an XObject,
+    for documents holding several resumes; otherwise paint_resume inlines
+    the forms that don't pay off.
+    """
+    def __init__(self, c, shared_forms=False):
+        self.c = c
+        self.shared_forms = shared_forms
+        self.page_height = c._pagesize[1]
+        self._font = None
+        self._color = None
+
+    def start_page(self, page):
+        if page:
+            self.c.showPage()
+        self.reset()
+
+    def reset(self):
+        # showPage resets the graphics state
+        self._font = None
+        self._color = None
+
+    def _set_font(self, font_name, font_size):
+        if self._font != (font_name, font_size):
+            self.c.setFont(font_name, font_size)
+            self._font = (font_name, font_size)
+
+    def _set_color(self, color):
+        if self._color != color:
+            self.c.setFillColorRGB(*color)
+            self._color = color
+
+    def draw(self, ops, y):
+        c = self.c
+        for op in ops:
+            kind = op[0]
+            if kind == 'text':
+                _, x, dy, text, font_name, font_size, color = op
+                self._set_color(color)
+                self._set_font(font_name, font_size)
+                c.drawString(x, y - dy, text)
+            elif kind == 'rect':
+                _, x, dy, w, h, color = op
+                self._set_color(color)
+                c.rect(x, y - dy, w, h, fill=1)
+            elif kind == 'circle':
+                _, x, dy, r, color = op
+                self._set_color(color)
+                c.circle(x, y - dy, r, fill=1)
+            elif kind == 'image':
+                _, x, dy, w, h, xobject = op
+                draw_photo(c, xobject, x, y - dy, w, h)
+            elif kind == 'form':
+                self._use_form(op[1], op[2])
+
+    def _use_form(self, name, ops):
+        c = self.c
+        if not c._doc.hasForm(name):
+            # Drawn with a fresh graphics state; the page's state is
+            # restored by endForm
+            saved = self._font, self._color
+            c.beginForm(name)
+            self.reset()
+            self.draw(ops, self.page_height)
+            c.endForm()
+            self._font, self._color = saved
+        c.doForm(name)
+
+def paint_resume(painter, resume, pages=None):
+    """
+    Paginates the columns and hands them to a painter page by page, starting
+    every page after the first with the theme's continuation background. A
+    painter has start_page(page) and draw(ops, y), with y measured up from
+    the bottom edge like in PDF. pages limits drawing to those page numbers.
+    A painter whose shared_forms is false gets the forms that wouldn't make
+    the document smaller inlined. Returns the number of pages of the whole
+    resume.
+    """
+    theme = resume.theme
+    height = theme.page_height
+    columns = [
+        paginate(blocks, height - column.top, height - theme.continuation_top, theme.bottom_margin)
+        for column, blocks in zip(theme.columns, resume.columns)
+    ]
+    page_count = max([p for placements in columns for p, _, _ in placements] + [0]) + 1
+
+    first_page, continuation_page = resume.first_page, theme.continuation_page
+    if not getattr(painter, 'shared_forms', True):
+        first_page = inline_forms(first_page, 1)
+        continuation_page = inline_forms(continuation_page, page_count - 1)
+
+    positions = [0] * len(columns)
+    times = [0] * len(columns)
+    for page in range(page_count):
+        if pages is not None and page not in pages:
+            continue
+        # The page background counts towards the first column
+        start = time.perf_counter()
+        painter.start_page(page)
+        painter.draw(first_page if page == 0 else continuation_page, height)
+        for k, placements in enumerate(columns):
+            i = positions[k]
+            while i < len(placements) and placements[i][0] <= page:
+                if placements[i][0] == page:
+                    painter.draw(placements[i][2].ops, placements[i][1])
+                i += 1
+            positions[k] = i
+            end = time.perf_counter()
+            times[k] += end - start
+            start = end
+
+    for column, seconds in zip(theme.columns, times):
+        observe(column.name, seconds)
+    return page_count
+
+def draw_resume(c, resume, shared_forms=False):
+    """
+    Draws the resume onto a ReportLab canvas. shared_forms is for documents
+    that hold more resumes than this one.
+    """
+    paint_resume(CanvasPainter(c, shared_forms), resume)
@@ -0,0 +1,121 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram buckets in seconds: the Prometheus client defaults, extended
+# down to half a millisecond since most stages finish in a few milliseconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+# What the stages timed in this context produce: pdf, or png and svg for
+# previews, which run the same stages far more often and would otherwise
+# drown out those of PDF generation
+current_output = ContextVar('current_output', default='pdf')
+
+class Registry:
+    """
+    Process wide timing histograms, one per render stage and output. Each
+    worker process keeps its own, so scrape every worker or aggregate on the
+    Prometheus side.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage, output='pdf'):
+        key = (stage, output)
+        histogram = self.stages.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds, output=None):
+        self.histogram(stage, output or current_output.get()).observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+    def render(self, extra=None):
+        """
+        Prometheus text exposition of all stage histograms and counters.
+        extra maps further metric names to values, e.g. cache counters.
+        """
+        lines = [
+            '# HELP pdf_stage_seconds Time spent in each stage of PDF generation',
+            '# TYPE pdf_stage_seconds histogram',
+        ]
+        for stage, output in sorted(self.stages):
+            histogram = self.stages[stage, output]
+            counts, total, count = histogram.snapshot()
+            labels = f'stage="{stage}",output="{output}"'
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'pdf_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'pdf_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'pdf_stage_seconds_sum{{{labels}}} {total}')
+            lines.append(f'pdf_stage_seconds_count{{{labels}}} {count}')
+
+        with self._lock:
+            values = dict(self.counters)
+        values.update(extra or {})
+        for name in sorted(values):
+            kind = 'counter' if name.endswith('_total') else 'gauge'
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {values[name]}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def observe(stage, seconds):
+    registry.observe(stage, seconds)
+
+@contextmanager
+def output(name):
+    """
+    Labels the stages timed in the enclosed block with the output name
+    """
+    token = current_output.set(name)
+    try:
+        yield
+    finally:
+        current_output.reset(token)
+
+@contextmanager
+def span(stage):
+    """
+    Times the enclosed block into the histogram of the given stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(stage, time.perf_counter() - start)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from reportlab import rl_config
+from reportlab.pdfbase import pdfdoc
+
+# Settings that trade output size against fidelity and compatibility.
+#   page_compression  Flate compress page and form content streams
+#   ascii85           wrap binary streams in ASCII85, which makes them 25%
+#                     larger but keeps the file 7-bit clean
+#   photo_jpeg        encode every photo as JPEG, not only JPEG uploads
+#   jpeg_quality      quality of re-encoded photos
+#   photo_dpi         resolution of the embedded photo at its printed size
+#   strip_redundant   leave out entries readers ignore or assume anyway:
+#                     ReportLab's placeholder title, author, subject and
+#                     keywords, the obsolete ProcSet arrays and the empty
+#                     page transition and zero rotation of every page
+# Fonts need no setting: the design uses the standard 14 fonts, which are
+# never embedded, and ReportLab always subsets embedded TrueType fonts.
+OutputProfile = namedtuple(
+    'OutputProfile', 'name page_compression ascii85 photo_jpeg jpeg_quality photo_dpi strip_redundant'
+)
+
+PROFILES = {
+    # The canvas defaults, as every PDF was rendered before profiles existed
+    'default': OutputProfile('default', True, True, False, 90, 72, False),
+    # For mailing and storing resumes in bulk
+    'compact': OutputProfile('compact', True, False, True, 70, 72, True),
+}
+
+DEFAULT_PROFILE = PROFILES['default']
+
+# Invariant output, for PDFs that are byte for byte identical whenever the
+# input is: the creation date is fixed (to SOURCE_DATE_EPOCH if set, else
+# 2000-01-01) and the document ID is derived from the content rather than
+# the time. Photos are already encoded deterministically. Renders take
+# invariant=True/False, defaulting to PDF_INVARIANT=1.
+INVARIANT = os.environ.get('PDF_INVARIANT') == '1'
+
+def is_invariant(invariant=None):
+    return INVARIANT if invariant is None else bool(invariant)
+
+def get_profile(name=None):
+    """
+    Looks up an output profile by name, None meaning the default one.
+    Raises ValueError for unknown names.
+    """
+    if name is None:
+        return DEFAULT_PROFILE
+    if isinstance(name, OutputProfile):
+        return name
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown output profile '{name}', expected one of {', '.join(PROFILES)}") from None
+
+# rl_config.useA85 and the standard ProcSet list are process wide settings
+# that ReportLab reads while loading images and writing out the document,
+# so renders in different threads take turns changing them
+_settings_lock = threading.Lock()
+
+@contextmanager
+def reportlab_settings(profile):
+    """
+    Applies the ReportLab globals of a profile for the enclosed block
+    """
+    resources = pdfdoc.PDFResourceDictionary
+    with _settings_lock:
+        saved = rl_config.useA85, resources.stdprocs
+        rl_config.useA85 = int(profile.ascii85)
+        if profile.strip_redundant:
+            # Empty ProcSet arrays are not written at all
+            resources.stdprocs = []
+        try:
+            yield
+        finally:
+            rl_config.useA85, resources.stdprocs = saved
+
+class _BareInfo(pdfdoc.PDFInfo):
+    # Document info with only the producer and creation date
+    def format(self, document):
+        return pdfdoc.PDFDictionary({
+            'Producer': pdfdoc.PDFString(self.producer),
+            'CreationDate': pdfdoc.PDFDate(ts=document._timeStamp, dateFormatter=self._dateFormatter),
+        }).format(document)
+
+def prepare_canvas(c, profile):
+    """
+    Applies the canvas level settings of a profile to a new canvas
+    """
+    c.setPageCompression(int(profile.page_compression))
+    if profile.strip_redundant:
+        info = _BareInfo()
+        info.producer = c._doc.info.producer
+        c._doc.info = info
+
+def encode_finished_pages(c, profile, start=0):
+    """
+    Encodes the content streams of the pages finished so far, from page
+    number start on, the way they would be encoded when the document is
+    written. ReportLab keeps page content as uncompressed text until then,
+    so long documents hold several times their final size in memory without
+    this.
+    """
+    if not profile.page_compression:
+        return
+    filters = [pdfdoc.PDFBase85Encode, pdfdoc.PDFZCompress] if profile.ascii85 else [pdfdoc.PDFZCompress]
+    for page in c._doc.Pages.pages[start:]:
+        if page.Contents or not page.stream:
+            continue
+        content = page.stream
+        for f in reversed(filters):
+            content = f.encode(content)
+        dictionary = pdfdoc.PDFDictionary({'Filter': pdfdoc.PDFArray([pdfdoc.PDFName(f.pdfname) for f in filters])})
+        page.Contents = pdfdoc.PDFStream(dictionary, content)
+        page.stream = None
+
+def with_content_id(data):
+    """
+    Replaces the document ID in the trailer of a PDF with the first 16
+    bytes of the SHA-256 of the whole file. ReportLab's invariant ID is the
+    same for every document, and its usual one changes with the time. The
+    ID keeps its length and comes after the cross reference table, so no
+    offsets move.
+    """
+    start = data.index(b'[', data.rindex(b'/ID'))
+    end = data.index(b']', start) + 1
+    digest = hashlib.sha256(data).hexdigest()[:32].encode('ascii')
+    return data[:start] + b'[<' + digest + b'><' + digest + b'>]' + data[end:]
+
+def pdf_data(c, profile):
+    """
+    Finishes the canvas and returns the PDF bytes, written out with the
+    settings of the profile, and with a content derived ID if the canvas
+    was created with invariant=1
+    """
+    if profile.strip_redundant:
+        if c._code:
+            c.showPage()
+        for page in c._doc.Pages.pages:
+            page.Trans = page.Rotate = None
+    with reportlab_settings(profile):
+        data = c.getpdfdata()
+    if c._doc.invariant:
+        data = with_content_id(data)
+    return data
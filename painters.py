@@ -0,0 +1,232 @@
+import base64
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape, quoteattr
+
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# Fallbacks after the standard font families in SVG, which leaves the actual
+# font to the viewer
+SVG_FALLBACKS = {
+    'Helvetica': 'Arial, sans-serif',
+    'Times': 'Times New Roman, serif',
+    'Courier': 'Courier New, monospace',
+}
+
+# Vertical gap between the pages of an SVG document
+SVG_PAGE_GAP = 20
+
+def _rgb(color):
+    return tuple(int(round(channel * 255)) for channel in color)
+
+@lru_cache(maxsize=64)
+def font_file(font_name):
+    """
+    Path of the file behind a font registered with ReportLab. For the
+    standard fonts these are the metric compatible clones ReportLab ships,
+    so text wrapped with the PDF metrics fits the same way in raster output.
+    """
+    face = pdfmetrics.getFont(font_name).face
+    # TrueType faces know their file, Type 1 faces look it up
+    return getattr(face, 'filename', None) or face.findT1File()
+
+@lru_cache(maxsize=64)
+def _font(font_name, pixel_size):
+    return ImageFont.truetype(font_file(font_name), pixel_size)
+
+@lru_cache(maxsize=64)
+def svg_font(font_name):
+    """
+    font-family, font-weight and font-style of a ReportLab font in SVG
+    """
+    if font_name in pdfmetrics.standardFonts:
+        base = font_name.split('-')[0]
+        family = f"{base}, {SVG_FALLBACKS.get(base, 'sans-serif')}"
+    else:
+        family = pdfmetrics.getFont(font_name).face.familyName
+        if isinstance(family, bytes):
+            family = family.decode('latin-1')
+        family = f"{family}, sans-serif"
+    weight = 'bold' if 'Bold' in font_name else 'normal'
+    style = 'italic' if 'Italic' in font_name or 'Oblique' in font_name else None
+    return family, weight, style
+
+@lru_cache(maxsize=8192)
+def _glyph(font_name, pixel_size, char):
+    """
+    Coverage mask of one character and its offset from the pen position on
+    the baseline, or None for blank characters
+    """
+    font = _font(font_name, pixel_size)
+    left, top, right, bottom = font.getbbox(char, anchor='ls')
+    if right <= left or bottom <= top:
+        return None
+    mask = Image.new('L', (right - left, bottom - top))
+    ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=255, anchor='ls')
+    return mask, left, top
+
+@lru_cache(maxsize=4096)
+def _advance(font_name, char):
+    # Width of the character at size 1, from the same metrics as the PDF
+    return stringWidth(char, font_name, 1)
+
+class ImagePainter:
+    """
+    Draws ops onto PIL images with ImageDraw, one RGB image per page, at
+    scale pixels per point. Nothing is anti-aliased except text, which is
+    plenty for previews.
+
+    FreeType is slow at rendering whole lines, so text is set glyph by glyph
+    from cached masks, advancing by the PDF font metrics. ReportLab doesn't
+    kern either, so characters land where they do in the PDF.
+    """
+    def __init__(self, scale, page_size):
+        self.scale = scale
+        self.page_size = page_size
+        self.page_height = page_size[1]
+        self.size = (round(page_size[0] * scale), round(page_size[1] * scale))
+        self.pages = []
+        self.image = None
+        self._draw = None
+
+    def start_page(self, page):
+        self.image = Image.new('RGB', self.size, (255, 255, 255))
+        self._draw = ImageDraw.Draw(self.image)
+        self.pages.append(self.image)
+
+    def _point(self, x, y):
+        # PDF y runs up from the bottom edge, image y down from the top
+        return x * self.scale, (self.page_height - y) * self.scale
+
+    def draw(self, ops, y):
+        draw = self._draw
+        for op in ops:
+            kind = op[0]
+            if kind == 'text':
+                _, x, dy, text, font_name, font_size, color = op
+                self._text(x, y - dy, text, font_name, font_size, _rgb(color))
+            elif kind == 'rect':
+                _, x, dy, w, h, color = op
+                left, top = self._point(x, y - dy + h)
+                right, bottom = self._point(x + w, y - dy)
+                draw.rectangle((left, top, right, bottom), fill=_rgb(color))
+            elif kind == 'circle':
+                _, x, dy, r, color = op
+                cx, cy = self._point(x, y - dy)
+                r *= self.scale
+                draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=_rgb(color))
+            elif kind == 'image':
+                _, x, dy, w, h, image = op
+                left, top = self._point(x, y - dy + h)
+                size = (round(w * self.scale), round(h * self.scale))
+                if image.size != size:
+                    image = image.resize(size, Image.Resampling.BILINEAR)
+                self.image.paste(image, (round(left), round(top)))
+            elif kind == 'form':
+                # Forms open their page and cover it entirely
+                self.image.paste(_background(op[2], self.scale, self.page_size))
+
+    def _text(self, x, y, text, font_name, font_size, color):
+        pixel_size = max(1, round(font_size * self.scale))
+        pen, baseline = self._point(x, y)
+        baseline = round(baseline)
+        step = font_size * self.scale
+        for char in text:
+            glyph = _glyph(font_name, pixel_size, char)
+            if glyph is not None:
+                mask, left, top = glyph
+                self.image.paste(color, (round(pen) + left, baseline + top), mask)
+            pen += _advance(font_name, char) * step
+
+# A full page image each, up to a few MB at the largest preview width, so
+# only the backgrounds of the last few themes and widths are kept
+@lru_cache(maxsize=8)
+def _background(ops, scale, page_size):
+    """
+    A form's ops drawn on a blank page at scale
+    """
+    painter = ImagePainter(scale, page_size)
+    painter.start_page(0)
+    painter.draw(ops, page_size[1])
+    return painter.image
+
+def _num(value):
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+class SvgPainter:
+    """
+    Builds one SVG document with the pages stacked top to bottom. Forms
+    become <defs> referenced with <use>, like the form XObjects in the PDF.
+    """
+    def __init__(self, page_size):
+        self.page_width, self.page_height = page_size
+        self.parts = []
+        self.forms = {}
+        self.page_count = 0
+        self._offset = 0
+
+    def start_page(self, page):
+        if self.page_count:
+            self.parts.append('</g>')
+        self._offset = self.page_count * (self.page_height + SVG_PAGE_GAP)
+        self.page_count += 1
+        self.parts.append(f'<g transform="translate(0 {_num(self._offset)})">')
+        self.parts.append(f'<rect width="{_num(self.page_width)}" height="{_num(self.page_height)}" fill="#fff"/>')
+
+    def draw(self, ops, y, out=None):
+        out = self.parts if out is None else out
+        page_height = self.page_height
+        for op in ops:
+            kind = op[0]
+            if kind == 'text':
+                _, x, dy, text, font_name, font_size, color = op
+                family, weight, style = svg_font(font_name)
+                style = f' font-style="{style}"' if style else ''
+                out.append(
+                    f'<text x="{_num(x)}" y="{_num(page_height - y + dy)}" font-family={quoteattr(family)} '
+                    f'font-weight="{weight}"{style} font-size="{_num(font_size)}" fill="{_hex(color)}" '
+                    f'xml:space="preserve">{escape(text)}</text>'
+                )
+            elif kind == 'rect':
+                _, x, dy, w, h, color = op
+                out.append(
+                    f'<rect x="{_num(x)}" y="{_num(page_height - y + dy - h)}" '
+                    f'width="{_num(w)}" height="{_num(h)}" fill="{_hex(color)}"/>'
+                )
+            elif kind == 'circle':
+                _, x, dy, r, color = op
+                out.append(
+                    f'<circle cx="{_num(x)}" cy="{_num(page_height - y + dy)}" r="{_num(r)}" fill="{_hex(color)}"/>'
+                )
+            elif kind == 'image':
+                _, x, dy, w, h, image = op
+                encoded = BytesIO()
+                image.save(encoded, format='JPEG', quality=85)
+                out.append(
+                    f'<image x="{_num(x)}" y="{_num(page_height - y + dy - h)}" width="{_num(w)}" height="{_num(h)}" '
+                    f'href="data:image/jpeg;base64,{base64.b64encode(encoded.getvalue()).decode("ascii")}"/>'
+                )
+            elif kind == 'form':
+                _, name, form_ops = op
+                if name not in self.forms:
+                    body = []
+                    self.draw(form_ops, page_height, body)
+                    self.forms[name] = ''.join(body)
+                out.append(f'<use href="#{name}"/>')
+
+    def document(self):
+        height = self.page_count * (self.page_height + SVG_PAGE_GAP) - SVG_PAGE_GAP
+        defs = ''.join(f'<g id="{name}">{body}</g>' for name, body in self.forms.items())
+        return ''.join([
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(self.page_width)}" height="{_num(height)}" '
+            f'viewBox="0 0 {_num(self.page_width)} {_num(height)}">',
+            f'<defs>{defs}</defs>',
+            *self.parts,
+            '</g>' if self.page_count else '',
+            '</svg>',
+        ])
+
+def _hex(color):
+    return '#%02x%02x%02x' % _rgb(color)
@@ -0,0 +1,212 @@
+import copy
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc
+
+from output_profile import DEFAULT_PROFILE, reportlab_settings
+
+logger = logging.getLogger(__name__)
+
+# Uploads above this many pixels are rejected before decoding. 40 MP covers
+# current phone cameras while stopping decompression bombs.
+MAX_PHOTO_PIXELS = 40_000_000
+
+# Decode and box-reduce to at least this multiple of the target size before
+# the final LANCZOS pass, like Image.thumbnail does
+REDUCING_GAP = 2.0
+
+# EXIF orientation tag and the transpose that turns each value upright
+ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+class PhotoTooLarge(ValueError):
+    pass
+
+class PhotoCache:
+    """
+    Small LRU of processed photos keyed by the digest of the upload and the
+    target size, so a photo is decoded, resized and compressed only once.
+    Holds image XObjects for PDF output and PIL images for previews.
+    """
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            xobject = self._entries.get(key)
+            if xobject is not None:
+                self._entries.move_to_end(key)
+            return xobject
+
+    def put(self, key, xobject):
+        with self._lock:
+            self._entries[key] = xobject
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+photo_cache = PhotoCache()
+
+def flatten_image(img):
+    """
+    Converts an image to RGB, compositing any transparency onto white
+    """
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def preprocess_photo(img, size, orientation=1):
+    """
+    Shrinks an opened image to size x size RGB in as few full-resolution
+    passes as possible: JPEG uploads are decoded at 1/2, 1/4 or 1/8 scale in
+    the DCT domain, other formats are box-reduced by an integer factor, and
+    only the remaining small image is rotated upright and LANCZOS resampled.
+    """
+    gap = int(size * REDUCING_GAP)
+    if img.format == 'JPEG':
+        img.draft(None, (gap, gap))
+
+    img = flatten_image(img)
+    factor = (max(1, img.width // gap), max(1, img.height // gap))
+    if factor != (1, 1):
+        img = img.reduce(factor)
+
+    if orientation in ORIENTATION_TRANSPOSE:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return img.resize((size, size), Image.Resampling.LANCZOS)
+
+def open_photo(photo_bytes):
+    """
+    Opens an upload without decoding it, rejecting decompression bombs
+    """
+    img = Image.open(BytesIO(photo_bytes))
+    logger.debug("Image opened. Mode: %s, Size: %s", img.mode, img.size)
+
+    # Image.open only reads the header, so this runs before any pixel data
+    # is decoded
+    if img.width * img.height > MAX_PHOTO_PIXELS:
+        raise PhotoTooLarge(f"Photo has {img.width * img.height} pixels, the limit is {MAX_PHOTO_PIXELS}")
+    return img
+
+def decoded_size(photo_bytes):
+    """
+    Bytes the upload takes once decoded, read from its header alone: an
+    upper bound, as JPEGs are mostly decoded at reduced scale. Uploads that
+    cannot be opened count as 0 and fail later, when they are rendered.
+    """
+    try:
+        img = Image.open(BytesIO(photo_bytes))
+    except Exception:
+        return 0
+    return img.width * img.height * len(img.getbands())
+
+def build_photo_xobject(photo_bytes, size, name, profile=DEFAULT_PROFILE):
+    """
+    Decodes and resizes the upload and wraps it in an image XObject. JPEG
+    uploads stay JPEG so ReportLab embeds the DCT stream as is; everything
+    else is embedded losslessly from the decoded pixels, unless the output
+    profile asks for JPEG throughout.
+    """
+    img = open_photo(photo_bytes)
+    is_jpeg = img.format == 'JPEG'
+    orientation = img.getexif().get(ORIENTATION, 1)
+    passthrough = is_jpeg and not profile.photo_jpeg
+    if passthrough and orientation == 1 and img.mode == 'RGB' and img.size == (size, size):
+        # Already the right size, embed the uploaded bytes untouched
+        reader = ImageReader(BytesIO(photo_bytes))
+    else:
+        img = preprocess_photo(img, size, orientation)
+        if is_jpeg or profile.photo_jpeg:
+            encoded = BytesIO()
+            img.save(encoded, format='JPEG', quality=profile.jpeg_quality, optimize=True)
+            encoded.seek(0)
+            reader = ImageReader(encoded)
+        else:
+            reader = ImageReader(img)
+
+    # The profile decides whether the stream is ASCII85 wrapped
+    with reportlab_settings(profile):
+        xobject = pdfdoc.PDFImageXObject(name, reader)
+    xobject.name = name
+    return xobject
+
+def photo_pixels(size, profile=DEFAULT_PROFILE):
+    """
+    Pixel size of a photo printed size points wide at the profile's DPI
+    """
+    return max(1, round(size * profile.photo_dpi / 72))
+
+def load_photo(photo_bytes, size, profile=DEFAULT_PROFILE, cache=photo_cache):
+    """
+    Returns the image XObject for an uploaded photo printed size points
+    wide, reusing the cached one if the same photo was processed before.
+    cache=None processes it without looking at or filling the cache, for
+    photos that are used once. The XObject is named after the photo's
+    digest either way, so a document shows identical photos from one image.
+    """
+    digest = hashlib.sha256(photo_bytes).hexdigest()
+    pixels = photo_pixels(size, profile)
+    key = f"{digest}-{pixels}-{profile.name}"
+    xobject = cache.get(key) if cache is not None else None
+    if xobject is None:
+        name = f"photo_{digest[:16]}_{pixels}_{profile.name}"
+        xobject = build_photo_xobject(photo_bytes, pixels, name, profile)
+        if cache is not None:
+            cache.put(key, xobject)
+    return xobject
+
+def load_photo_image(photo_bytes, pixels):
+    """
+    Returns an uploaded photo as a pixels x pixels RGB PIL image, for the
+    output backends that draw pixels rather than embed a PDF image
+    """
+    digest = hashlib.sha256(photo_bytes).hexdigest()
+    key = f"{digest}-{pixels}-image"
+    image = photo_cache.get(key)
+    if image is None:
+        img = open_photo(photo_bytes)
+        image = preprocess_photo(img, pixels, img.getexif().get(ORIENTATION, 1))
+        photo_cache.put(key, image)
+    return image
+
+def draw_photo(c, xobject, x, y, width, height):
+    """
+    Draws a photo XObject from load_photo, registering it with the document
+    the first time it is used. Mirrors what canvas.drawImage does, minus
+    re-hashing the pixel data on every call.
+    """
+    if not c._doc.hasForm(xobject.name):
+        # Registering tags the object with its document, so each document
+        # gets a shallow copy sharing the already encoded stream
+        c._doc.addForm(xobject.name, copy.copy(xobject))
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.translate(x, y)
+    c.scale(width, height)
+    c.doForm(xobject.name)
+    c.restoreState()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from resume import Resume
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the PDF output for the same input changes, so entries left
+# in an on-disk cache by an older version are not served again
+CACHE_VERSION = 8
+
+def cache_key(data, photo_bytes=None, **options):
+    """
+    Builds a content address for a render from the resume, the raw photo
+    bytes and any render options
+    """
+    if isinstance(data, Resume):
+        data = data.to_dict()
+    canonical = json.dumps(
+        {'version': CACHE_VERSION, 'data': data, 'options': options},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    digest = hashlib.sha256(canonical.encode('utf-8'))
+    if photo_bytes:
+        digest.update(hashlib.sha256(photo_bytes).digest())
+    return digest.hexdigest()
+
+class RenderCache:
+    """
+    Two tier cache of rendered PDFs. The memory tier is an LRU bounded by
+    entry count and total bytes; the optional disk tier lives in disk_dir and
+    evicts the least recently used files once disk_max_bytes is exceeded.
+    The disk index is per process, so disk_max_bytes bounds what one
+    process adds to the directory, not the directory's total size.
+    """
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024,
+                 disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            self._load_disk_index()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configures the cache from PDF_CACHE_SIZE, PDF_CACHE_DIR and
+        PDF_CACHE_DISK_BYTES
+        """
+        return cls(
+            max_entries=int(os.environ.get('PDF_CACHE_SIZE', 128)),
+            disk_dir=os.environ.get('PDF_CACHE_DIR') or None,
+            disk_max_bytes=int(os.environ.get('PDF_CACHE_DISK_BYTES', 512 * 1024 * 1024)),
+        )
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._memory_put(key, data)
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._memory),
+                'bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def _memory_put(self, key, data):
+        if len(data) > self.max_bytes or self.max_entries <= 0:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.pdf')
+
+    def _load_disk_index(self):
+        # Rebuild the LRU order from access times left by a previous process
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for filename in files:
+                if not filename.endswith('.pdf'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except OSError:
+                    # Evicted by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data
+
+    def _disk_put(self, key, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial PDF
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            # A full or read-only disk costs the cache entry, not the response
+            logger.warning("Could not write %s to the disk cache: %s", key, e)
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
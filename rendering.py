@@ -0,0 +1,235 @@
+import logging
+import string
+from io import BytesIO
+
+from PIL import Image
+from reportlab.pdfgen import canvas
+
+from incremental import LayoutSessions
+from layout import draw_resume, layout_resume, paint_resume
+from metrics import registry, span
+from output_profile import (
+    PROFILES, encode_finished_pages, get_profile, is_invariant, pdf_data, prepare_canvas,
+)
+from painters import ImagePainter, SvgPainter
+from resume import Resume, as_resume
+from photo import decoded_size, load_photo, load_photo_image, photo_cache
+from themes import get_theme, load_themes
+
+logger = logging.getLogger(__name__)
+
+# Layout sessions for incremental re-rendering while a resume is edited,
+# picked by the session parameter of /generate and /preview
+layout_sessions = LayoutSessions()
+
+# Theme files are compiled once, before the first request needs them
+themes = load_themes()
+
+def layout_for(data, photo, session=None, theme=None):
+    if session is not None:
+        return session.layout(data, photo, theme)
+    return layout_resume(data, photo, theme)
+
+# Memory a render takes besides the photo: the layout, the canvas and the
+# finished PDF of a long resume
+BASE_RENDER_BYTES = 1024 * 1024
+
+def render_cost(photo_bytes=None):
+    """
+    Estimated peak memory of rendering a resume, in bytes, for admission
+    control: the base cost plus the upload itself and its decoded pixels
+    """
+    if not photo_bytes:
+        return BASE_RENDER_BYTES
+    return BASE_RENDER_BYTES + len(photo_bytes) + decoded_size(photo_bytes)
+
+def book_cost(photos):
+    """
+    Estimated peak memory of rendering a book with these photos: the base
+    cost once, and every upload and its decoded pixels. Only one photo is
+    decoded at a time, but the book keeps growing as they are added.
+    """
+    return BASE_RENDER_BYTES + sum(len(photo) + decoded_size(photo) for photo in photos if photo)
+
+def create_pdf(data, photo=None, out=None, output_profile=None, session=None, theme=None, invariant=None):
+    """
+    Renders the resume and returns a BytesIO with the PDF, or writes it to
+    the file object given as out. data is a resume.Resume, or a dict that
+    as_resume turns into one. output_profile names one of the profiles
+    in output_profile.PROFILES, theme one of the themes in themes/, and a
+    LayoutSession as session reuses the sections that are unchanged since
+    its previous render. invariant=True renders the same input to the same
+    bytes every time; None leaves it to PDF_INVARIANT.
+    """
+    profile = get_profile(output_profile)
+    theme = get_theme(theme)
+    buffer = out if out is not None else BytesIO()
+    c = canvas.Canvas(buffer, pagesize=theme.page_size, invariant=int(is_invariant(invariant)))
+    prepare_canvas(c, profile)
+
+    # Handle photo if provided, falling back to the white circle
+    photo_xobject = None
+    if photo:
+        photo.seek(0)
+        photo_xobject = load_pdf_photo(photo.read(), theme, profile)
+
+    # Measure everything first, then draw page by page
+    with span('layout'):
+        resume = layout_for(data, photo_xobject, session, theme)
+    draw_resume(c, resume)
+
+    with span('save'):
+        buffer.write(pdf_data(c, profile))
+    if out is None:
+        buffer.seek(0)
+    return buffer
+
+def load_pdf_photo(photo_bytes, theme, profile, cache=photo_cache):
+    """
+    The photo XObject for a resume, or None to fall back to the placeholder
+    if the photo can't be processed
+    """
+    try:
+        with span('photo'):
+            return load_photo(photo_bytes, theme.photo.size, profile, cache)
+    except Exception as e:
+        logger.warning("Error processing photo: %s", e)
+        return None
+
+def create_book(records, out=None, output_profile=None, theme=None, invariant=None):
+    """
+    Renders many resumes into one PDF, each starting on a new page under an
+    outline entry with the candidate's name, and returns a BytesIO with it
+    or writes it to the file object given as out. records is an iterable
+    of (resume, photo_bytes) pairs. It is consumed one record at a time, so
+    it can be a generator reading from a file, and nothing is kept between
+    records but the finished pages, already compressed. ReportLab writes
+    the document only once it is complete, so memory still grows with the
+    compressed size of the book.
+
+    All resumes share the document's fonts and the theme's backgrounds,
+    which are drawn once as form XObjects, and identical photos are
+    embedded once. Photos skip the photo cache, which would only be
+    flushed by a book's worth of photos used once each.
+    """
+    profile = get_profile(output_profile)
+    theme = get_theme(theme)
+    buffer = out if out is not None else BytesIO()
+    c = canvas.Canvas(buffer, pagesize=theme.page_size, invariant=int(is_invariant(invariant)))
+    prepare_canvas(c, profile)
+    c.showOutline()
+
+    for i, (resume, photo_bytes) in enumerate(records):
+        resume = as_resume(resume)
+        if i:
+            c.showPage()
+            # The previous resume's pages are done
+            encode_finished_pages(c, profile, first_page)
+        first_page = c.getPageNumber() - 1
+        key = f"resume{i}"
+        c.bookmarkPage(key)
+        c.addOutlineEntry(' '.join(resume.name) or f"Resume {i + 1}", key, level=0)
+
+        photo_xobject = None
+        if photo_bytes:
+            photo_xobject = load_pdf_photo(photo_bytes, theme, profile, cache=None)
+        with span('layout'):
+            laid_out = layout_resume(resume, photo_xobject, theme)
+        draw_resume(c, laid_out, shared_forms=True)
+
+    with span('save'):
+        buffer.write(pdf_data(c, profile))
+    if out is None:
+        buffer.seek(0)
+    return buffer
+
+# Width of /preview images in pixels, unless the request asks for another
+PREVIEW_WIDTH = 400
+MAX_PREVIEW_WIDTH = 1240
+
+def load_preview_photo(photo, pixels):
+    # Same fallback to the white circle as create_pdf
+    if not photo:
+        return None
+    try:
+        with span('photo'):
+            photo.seek(0)
+            return load_photo_image(photo.read(), pixels)
+    except Exception as e:
+        logger.warning("Error processing photo: %s", e)
+        return None
+
+def create_png(data, photo=None, page=0, width=PREVIEW_WIDTH, session=None, theme=None):
+    """
+    Renders one page of the resume as a PNG width pixels wide, straight from
+    the layout without building a PDF. Returns None if there is no such
+    page.
+    """
+    theme = get_theme(theme)
+    scale = width / theme.page_width
+    photo_image = load_preview_photo(photo, round(theme.photo.size * scale))
+    with span('layout'):
+        resume = layout_for(data, photo_image, session, theme)
+    painter = ImagePainter(scale, theme.page_size)
+    paint_resume(painter, resume, pages={page})
+    if not painter.pages:
+        return None
+    with span('save'):
+        out = BytesIO()
+        painter.pages[0].save(out, format='PNG', compress_level=1)
+    return out.getvalue()
+
+def create_svg(data, photo=None, session=None, theme=None):
+    """
+    Renders the resume as a single SVG document with the pages one below the
+    other
+    """
+    theme = get_theme(theme)
+    photo_image = load_preview_photo(photo, theme.photo.size)
+    with span('layout'):
+        resume = layout_for(data, photo_image, session, theme)
+    painter = SvgPainter(theme.page_size)
+    paint_resume(painter, resume)
+    return painter.document()
+
+def render_pdf_bytes(data, photo_bytes=None, output_profile=None, theme=None, invariant=None):
+    photo = BytesIO(photo_bytes) if photo_bytes else None
+    return create_pdf(data, photo, output_profile=output_profile, theme=theme, invariant=invariant).getvalue()
+
+# Every printable character in each field, so the sample sets all of them
+# in every style a theme uses
+_SAMPLE_TEXT = ' '.join([string.ascii_letters, string.digits, string.punctuation])
+
+def _sample_resume():
+    return Resume.from_data({
+        'name': _SAMPLE_TEXT, 'title': _SAMPLE_TEXT, 'about': _SAMPLE_TEXT,
+        'phone': _SAMPLE_TEXT, 'email': _SAMPLE_TEXT, 'address': _SAMPLE_TEXT,
+        'edu_years': [_SAMPLE_TEXT], 'edu_school': [_SAMPLE_TEXT], 'edu_location': [_SAMPLE_TEXT],
+        'exp_years': [_SAMPLE_TEXT], 'exp_position': [_SAMPLE_TEXT], 'exp_description': [_SAMPLE_TEXT],
+        'skill_names': [_SAMPLE_TEXT], 'skill_levels': ['50'],
+    })
+
+def _sample_photo():
+    photo = BytesIO()
+    Image.new('RGB', (16, 16), (128, 128, 128)).save(photo, format='JPEG')
+    return photo
+
+def warm_up():
+    """
+    Does the work that is otherwise left to the first requests of a process:
+    renders a sample resume with every theme, as a PDF in every output
+    profile and as PNG and SVG previews, with and without a photo. That
+    loads the font metrics and the Pillow codecs and fills the text width,
+    glyph and preview background caches. Run before gunicorn forks its
+    workers, all of it is shared between them. The sample renders are left
+    out of the metrics.
+    """
+    sample = _sample_resume()
+    for theme in themes.values():
+        for profile in PROFILES:
+            create_pdf(sample, _sample_photo(), output_profile=profile, theme=theme)
+        create_pdf(sample, theme=theme)
+        create_png(sample, _sample_photo(), theme=theme)
+        create_png(sample, theme=theme)
+        create_svg(sample, _sample_photo(), theme=theme)
+    registry.reset()
@@ -0,0 +1,278 @@
+import base64
+import binascii
+import hashlib
+import json
+import math
+from dataclasses import dataclass
+
+# Fields of the resume data dict sent by the form, split into plain text
+# fields and the parallel lists that come from the repeated form inputs
+# (e.g. edu_years[])
+TEXT_FIELDS = ('name', 'title', 'about', 'phone', 'email', 'address')
+LIST_FIELDS = ('edu_years', 'edu_school', 'edu_location',
+               'exp_years', 'exp_position', 'exp_description',
+               'skill_names', 'skill_levels')
+
+# Lists that describe one entry per index and so must have equal lengths
+LIST_GROUPS = (('edu_years', 'edu_school', 'edu_location'),
+               ('exp_years', 'exp_position', 'exp_description'),
+               ('skill_names', 'skill_levels'))
+
+# Text is kept as a tuple of words: split once when the resume is read,
+# instead of on every layout, with whitespace normalized as a side effect.
+# ' '.join(words) gives back the normalized text.
+
+def words(text):
+    return tuple(text.split())
+
+def skill_level(value):
+    """
+    A skill level as a number from 0 to 100, clamping anything outside
+    """
+    try:
+        level = float(value)
+    except (TypeError, ValueError):
+        level = math.nan
+    if not math.isfinite(level):
+        raise ValueError(f"Skill level '{value}' is not a number")
+    return min(max(level, 0.0), 100.0)
+
+def _words(value, field):
+    if not isinstance(value, str):
+        raise ValueError(f"Field '{field}' must be a string")
+    return words(value)
+
+def _years(value, field):
+    # Record files may give years as numbers, e.g. edu_years: [2020]
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    return _words(value, field)
+
+def _entries(body, field):
+    entries = body.get(field, [])
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError(f"Field '{field}' must be a list of objects")
+    return entries
+
+def _number(level):
+    # 80 rather than 80.0 in JSON
+    return int(level) if level.is_integer() else level
+
+@dataclass(frozen=True, slots=True)
+class EducationEntry:
+    years: tuple
+    school: tuple
+    location: tuple
+
+@dataclass(frozen=True, slots=True)
+class ExperienceEntry:
+    years: tuple
+    position: tuple
+    description: tuple
+
+@dataclass(frozen=True, slots=True)
+class Skill:
+    name: tuple
+    level: float
+
+@dataclass(frozen=True, slots=True)
+class Resume:
+    """
+    A normalized resume, as laid out by layout.py. Built once per request
+    from the form, a JSON record or an /api/v1/resume body; immutable and
+    hashable, so sections of it can key layout caches.
+    """
+    name: tuple
+    title: tuple
+    about: tuple
+    phone: tuple
+    email: tuple
+    address: tuple
+    education: tuple = ()
+    experience: tuple = ()
+    skills: tuple = ()
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Builds a Resume from the form's data dict, or from a JSON resume
+        record using the same field names. Rejects input that would
+        otherwise fail half way through layout: text that isn't a string,
+        list entries that aren't strings (years may also be integers),
+        parallel lists of different lengths and skill levels that aren't
+        numbers.
+        """
+        text = {}
+        for field in TEXT_FIELDS:
+            value = data[field]
+            if not isinstance(value, str):
+                raise ValueError(f"Field '{field}' must be a string")
+            text[field] = words(value)
+        lists = {}
+        for field in LIST_FIELDS:
+            values = data.get(field, [])
+            if not isinstance(values, list):
+                raise ValueError(f"Field '{field}' must be a list")
+            lists[field] = values
+        for group in LIST_GROUPS:
+            if len({len(lists[field]) for field in group}) > 1:
+                raise ValueError(f"Fields {', '.join(group)} must have the same number of entries")
+
+        return cls(
+            education=tuple(
+                EducationEntry(
+                    _years(years, 'edu_years'),
+                    _words(school, 'edu_school'),
+                    _words(location, 'edu_location'),
+                )
+                for years, school, location
+                in zip(lists['edu_years'], lists['edu_school'], lists['edu_location'])
+            ),
+            experience=tuple(
+                ExperienceEntry(
+                    _years(years, 'exp_years'),
+                    _words(position, 'exp_position'),
+                    _words(description, 'exp_description'),
+                )
+                for years, position, description
+                in zip(lists['exp_years'], lists['exp_position'], lists['exp_description'])
+            ),
+            skills=tuple(
+                Skill(_words(name, 'skill_names'), skill_level(level))
+                for name, level in zip(lists['skill_names'], lists['skill_levels'])
+            ),
+            **text,
+        )
+
+    @classmethod
+    def from_dict(cls, body):
+        """
+        Builds a Resume from its dict form: an /api/v1/resume body, the
+        output of to_dict or a record from a file. Like from_data, rejects
+        text that isn't a string and entries that aren't objects, which
+        RESUME_SCHEMA already rules out for API bodies.
+        """
+        return cls(
+            *(_words(body.get(field, ''), field) for field in TEXT_FIELDS),
+            education=tuple(
+                EducationEntry(
+                    _words(entry.get('years', ''), 'education.years'),
+                    _words(entry['school'], 'education.school'),
+                    _words(entry.get('location', ''), 'education.location'),
+                )
+                for entry in _entries(body, 'education')
+            ),
+            experience=tuple(
+                ExperienceEntry(
+                    _words(entry.get('years', ''), 'experience.years'),
+                    _words(entry['position'], 'experience.position'),
+                    _words(entry.get('description', ''), 'experience.description'),
+                )
+                for entry in _entries(body, 'experience')
+            ),
+            skills=tuple(
+                Skill(_words(skill['name'], 'skills.name'), skill_level(skill['level']))
+                for skill in _entries(body, 'skills')
+            ),
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        return as_resume(json.loads(text))
+
+    def to_dict(self):
+        """
+        The resume in the dict form of an /api/v1/resume body, with the
+        normalized text
+        """
+        data = {field: ' '.join(getattr(self, field)) for field in TEXT_FIELDS}
+        data['education'] = [
+            {'years': ' '.join(e.years), 'school': ' '.join(e.school), 'location': ' '.join(e.location)}
+            for e in self.education
+        ]
+        data['experience'] = [
+            {'years': ' '.join(e.years), 'position': ' '.join(e.position), 'description': ' '.join(e.description)}
+            for e in self.experience
+        ]
+        data['skills'] = [{'name': ' '.join(s.name), 'level': _number(s.level)} for s in self.skills]
+        return data
+
+    def to_json(self):
+        """
+        Canonical JSON encoding: equal resumes give equal bytes, whatever
+        the input they were built from
+        """
+        return json.dumps(
+            self.to_dict(), sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        ).encode('utf-8')
+
+    def digest(self):
+        return hashlib.sha256(self.to_json()).hexdigest()
+
+    def __reduce__(self):
+        # Pickled as nested tuples of the normalized strings, without the
+        # class reference and field names of every entry, for handing
+        # resumes to worker processes. That is as small as the form's data
+        # dict; the words are split again on loading.
+        return _unpickle, (
+            tuple(' '.join(getattr(self, field)) for field in TEXT_FIELDS),
+            tuple((' '.join(e.years), ' '.join(e.school), ' '.join(e.location)) for e in self.education),
+            tuple((' '.join(e.years), ' '.join(e.position), ' '.join(e.description)) for e in self.experience),
+            tuple((' '.join(s.name), s.level) for s in self.skills),
+        )
+
+def _unpickle(text, education, experience, skills):
+    return Resume(
+        *(words(value) for value in text),
+        education=tuple(
+            EducationEntry(words(years), words(school), words(location)) for years, school, location in education
+        ),
+        experience=tuple(
+            ExperienceEntry(words(years), words(position), words(description))
+            for years, position, description in experience
+        ),
+        skills=tuple(Skill(words(name), level) for name, level in skills),
+    )
+
+def as_resume(data):
+    """
+    Returns data as a Resume: one as is, or built from the form's data dict,
+    a JSON resume record or the dict form of to_dict
+    """
+    if isinstance(data, Resume):
+        return data
+    if any(field in data for field in LIST_FIELDS):
+        return Resume.from_data(data)
+    return Resume.from_dict(data)
+
+def decode_photo(value):
+    """
+    Decodes a photo sent base64 encoded in a JSON resume or record. Line
+    breaks and other whitespace are ignored, so wrapped base64 is fine, but
+    anything else outside the base64 alphabet is an error. Raises
+    ValueError for anything but valid base64 in a string.
+    """
+    if not isinstance(value, str):
+        raise ValueError("Field 'photo' must be a base64 string")
+    try:
+        return base64.b64decode(''.join(value.split()), validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Field 'photo' is not valid base64: {e}") from None
+
+def load_resumes(path):
+    """
+    Reads resumes from a JSON Lines file, one resume per line in any form
+    as_resume takes, without holding more than one line in memory
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield Resume.from_json(line)
+
+def dump_resumes(resumes, path):
+    """
+    Writes resumes to a JSON Lines file in their canonical encoding
+    """
+    with open(path, 'wb') as f:
+        for resume in resumes:
+            f.write(resume.to_json() + b'\n')
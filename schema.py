@@ -0,0 +1,105 @@
+class SchemaError(ValueError):
+    """
+    Raised for a value that does not match the schema. path is the location
+    of the offending value, e.g. "experience[2].position".
+    """
+    def __init__(self, path, message):
+        super().__init__(f"{path or 'body'}: {message}")
+        self.path = path
+        self.message = message
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+def _join(path, key):
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    return f"{path}.{key}" if path else key
+
+def compile_schema(schema):
+    """
+    Turns a schema into a tree of closures once, so validating a request is a
+    handful of function calls instead of a walk over the schema dict. Returns
+    validate(value), which raises SchemaError on the first mismatch and
+    returns the value unchanged otherwise.
+
+    Supports the JSON Schema keywords type (object, array, string, integer,
+    number, boolean), properties, required, additionalProperties (false
+    only), items, minLength, maxLength, minItems, maxItems, minimum and
+    maximum.
+    """
+    check = _compile(schema)
+
+    def validate(value):
+        check(value, '')
+        return value
+    return validate
+
+def _compile(schema):
+    checks = []
+
+    kind = schema.get('type')
+    if kind is not None:
+        expected = _TYPES[kind]
+
+        def check_type(value, path):
+            # bool is an int subclass, but true is not a number in JSON
+            if not isinstance(value, expected) or (isinstance(value, bool) and kind != 'boolean'):
+                raise SchemaError(path, f"expected {kind}")
+        checks.append(check_type)
+
+    if 'minLength' in schema or 'maxLength' in schema:
+        checks.append(_bounds(len, schema.get('minLength'), schema.get('maxLength'), 'length'))
+    if 'minItems' in schema or 'maxItems' in schema:
+        checks.append(_bounds(len, schema.get('minItems'), schema.get('maxItems'), 'number of items'))
+    if 'minimum' in schema or 'maximum' in schema:
+        checks.append(_bounds(None, schema.get('minimum'), schema.get('maximum'), 'value'))
+
+    if 'properties' in schema:
+        properties = {key: _compile(sub) for key, sub in schema['properties'].items()}
+        required = tuple(schema.get('required', ()))
+        closed = schema.get('additionalProperties', True) is False
+
+        def check_object(value, path):
+            for key in required:
+                if key not in value:
+                    raise SchemaError(_join(path, key), "is required")
+            for key, item in value.items():
+                check_item = properties.get(key)
+                if check_item is not None:
+                    check_item(item, _join(path, key))
+                elif closed:
+                    raise SchemaError(_join(path, key), "is not allowed")
+        checks.append(check_object)
+
+    if 'items' in schema:
+        check_item = _compile(schema['items'])
+
+        def check_items(value, path):
+            for i, item in enumerate(value):
+                check_item(item, _join(path, i))
+        checks.append(check_items)
+
+    checks = tuple(checks)
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, path):
+        for check in checks:
+            check(value, path)
+    return check_all
+
+def _bounds(measure, low, high, what):
+    def check_bounds(value, path):
+        size = measure(value) if measure else value
+        if low is not None and size < low:
+            raise SchemaError(path, f"{what} must be at least {low}")
+        if high is not None and size > high:
+            raise SchemaError(path, f"{what} must be at most {high}")
+    return check_bounds
@@ -0,0 +1,54 @@
+import gzip
+import hashlib
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    # Optional, pages are still served gzipped or uncompressed without it
+    brotli = None
+
+class StaticPage:
+    """
+    A page rendered once and kept as encoded bytes. Every variant is
+    compressed up front, so serving it is a dictionary lookup.
+    """
+    def __init__(self, body, mimetype='text/html; charset=utf-8', max_age=86400):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.cache_control = f'public, max-age={max_age}, stale-while-revalidate={max_age}'
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+        # Preferred encodings first
+        self.variants = {}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+        self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        self.variants['identity'] = body
+
+    def variant_etag(self, encoding):
+        # Strong ETags have to differ between content codings
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+    def choose_encoding(self, request):
+        for encoding in self.variants:
+            if encoding == 'identity' or request.accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+    def response(self, request):
+        encoding = self.choose_encoding(request)
+        etag = self.variant_etag(encoding)
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        if etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
@@ -0,0 +1,96 @@
+import queue
+import threading
+
+# Size of the pieces handed to the WSGI server
+CHUNK_SIZE = 64 * 1024
+
+class ClientGone(Exception):
+    pass
+
+class QueueWriter:
+    """
+    Write-only file object that passes whatever is written to it on to a
+    reading generator in CHUNK_SIZE pieces. The queue is bounded, so a slow
+    client throttles the writer instead of output piling up in memory.
+    """
+    def __init__(self, max_chunks=16):
+        self._queue = queue.Queue(max_chunks)
+        self._closed = threading.Event()
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._closed.is_set():
+                    raise ClientGone()
+
+    def write(self, data):
+        view = memoryview(data)
+        for start in range(0, len(view), CHUNK_SIZE):
+            self._put(bytes(view[start:start + CHUNK_SIZE]))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self, error=None):
+        try:
+            self._put(error)
+        except ClientGone:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Unblocks the writer if the client disconnected half way
+            self._closed.set()
+
+def stream_render(render, *args, max_chunks=16, **kwargs):
+    """
+    Calls render(*args, out=writer, **kwargs) on a background thread and
+    returns a generator over the chunks it writes. The render runs at most
+    max_chunks ahead of the reader; 0 lets it run to the end regardless,
+    for output that is kept whole anyway.
+    """
+    writer = QueueWriter(max_chunks)
+
+    def run():
+        try:
+            render(*args, out=writer, **kwargs)
+        except ClientGone:
+            return
+        except Exception as e:
+            writer.finish(e)
+        else:
+            writer.finish()
+
+    threading.Thread(target=run, daemon=True).start()
+    return iter(writer)
+
+def iter_chunks(data):
+    """
+    Yields already rendered bytes in CHUNK_SIZE pieces
+    """
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE].tobytes()
+
+def tee_to_cache(chunks, cache, key):
+    """
+    Passes chunks through and stores the complete output in the cache once
+    the stream has finished
+    """
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.put(key, b''.join(parts))
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from admission import RenderScheduler, Saturated
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def start_waiter(scheduler, cost, results, name):
+    """
+    Starts a thread that acquires a slot, records name and releases it, and
+    returns once the thread is in the queue
+    """
+    queued = scheduler.stats()['queued']
+
+    def run():
+        try:
+            token = scheduler.acquire(cost)
+        except Saturated:
+            results.append(('rejected', name))
+            return
+        results.append(name)
+        scheduler.release(token)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_until(lambda: scheduler.stats()['queued'] == queued + 1)
+    return thread
+
+def test_admits_within_limits():
+    scheduler = RenderScheduler(max_concurrent=2, max_bytes=100, max_queue=0, max_wait=0)
+    first = scheduler.acquire(40)
+    second = scheduler.acquire(40)
+    assert scheduler.stats()['active'] == 2
+    assert scheduler.stats()['active_bytes'] == 80
+    scheduler.release(first)
+    scheduler.release(second)
+    assert scheduler.stats()['active'] == 0
+    assert scheduler.stats()['active_bytes'] == 0
+    assert scheduler.stats()['admitted'] == 2
+
+def test_waiters_are_admitted_in_order():
+    scheduler = RenderScheduler(max_concurrent=1, max_bytes=100, max_queue=8, max_wait=5)
+    held = scheduler.acquire(10)
+    results = []
+    threads = [start_waiter(scheduler, 10, results, name) for name in range(5)]
+    scheduler.release(held)
+    for thread in threads:
+        thread.join()
+    assert results == [0, 1, 2, 3, 4]
+
+def test_small_render_does_not_overtake_a_waiting_large_one():
+    scheduler = RenderScheduler(max_concurrent=4, max_bytes=100, max_queue=8, max_wait=5)
+    held = scheduler.acquire(60)
+    results = []
+    large = start_waiter(scheduler, 60, results, 'large')
+    # Fits in the remaining budget, but waits behind the large render
+    small = start_waiter(scheduler, 10, results, 'small')
+    time.sleep(0.05)
+    assert results == []
+    scheduler.release(held)
+    large.join()
+    small.join()
+    assert results == ['large', 'small']
+
+def test_memory_budget_holds_back_renders():
+    scheduler = RenderScheduler(max_concurrent=4, max_bytes=100, max_queue=8, max_wait=0.05)
+    held = scheduler.acquire(70)
+    with pytest.raises(Saturated):
+        scheduler.acquire(40)
+    scheduler.acquire(30)
+    assert scheduler.stats()['active_bytes'] == 100
+    scheduler.release(held)
+
+def test_render_larger_than_the_budget_runs_alone():
+    scheduler = RenderScheduler(max_concurrent=4, max_bytes=100, max_queue=8, max_wait=0.05)
+    token = scheduler.acquire(500)
+    assert scheduler.stats()['active_bytes'] == 100
+    with pytest.raises(Saturated):
+        scheduler.acquire(1)
+    scheduler.release(token)
+    scheduler.release(scheduler.acquire(500))
+
+def test_wait_times_out():
+    scheduler = RenderScheduler(max_concurrent=1, max_bytes=100, max_queue=8, max_wait=0.05)
+    held = scheduler.acquire(10)
+    start = time.monotonic()
+    with pytest.raises(Saturated) as error:
+        scheduler.acquire(10)
+    assert time.monotonic() - start >= 0.05
+    assert error.value.retry_after >= 1
+    stats = scheduler.stats()
+    assert (stats['queued'], stats['rejected'], stats['timeouts']) == (0, 1, 1)
+    scheduler.release(held)
+
+def test_timed_out_waiter_lets_the_next_one_in():
+    scheduler = RenderScheduler(max_concurrent=1, max_bytes=100, max_queue=8, max_wait=0.2)
+    held = scheduler.acquire(10)
+    results = []
+    first = start_waiter(scheduler, 10, results, 'first')
+    scheduler.max_wait = 5
+    second = start_waiter(scheduler, 10, results, 'second')
+    first.join()
+    assert results == [('rejected', 'first')]
+    scheduler.release(held)
+    second.join()
+    assert results == [('rejected', 'first'), 'second']
+
+def test_full_queue_rejects_straight_away():
+    scheduler = RenderScheduler(max_concurrent=1, max_bytes=100, max_queue=1, max_wait=5)
+    held = scheduler.acquire(10)
+    results = []
+    waiter = start_waiter(scheduler, 10, results, 'waiter')
+    start = time.monotonic()
+    with pytest.raises(Saturated):
+        scheduler.acquire(10)
+    assert time.monotonic() - start < 1
+    stats = scheduler.stats()
+    assert (stats['rejected'], stats['timeouts']) == (1, 0)
+    scheduler.release(held)
+    waiter.join()
+    assert results == ['waiter']
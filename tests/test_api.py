@@ -0,0 +1,107 @@
+import base64
+import io
+import json
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module
+
+RESUME = {'name': 'Jane Doe', 'title': 'Engineer', 'skills': [{'name': 'Python', 'level': 80}]}
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+def jpeg():
+    out = io.BytesIO()
+    Image.new('RGB', (32, 32), (200, 20, 20)).save(out, format='JPEG')
+    return out.getvalue()
+
+def test_renders_json(client):
+    response = client.post('/api/v1/resume', json=RESUME)
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF-')
+
+def test_unsupported_media_type(client):
+    response = client.post('/api/v1/resume', data='name=Jane', content_type='text/plain')
+    assert response.status_code == 415
+    assert 'error' in response.json
+
+def test_malformed_json(client):
+    response = client.post('/api/v1/resume', data='{"name": ', content_type='application/json')
+    assert response.status_code == 400
+
+def test_schema_errors_name_the_field(client):
+    response = client.post('/api/v1/resume', json={'title': 'x'})
+    assert response.status_code == 400
+    assert response.json['error'] == "name: is required"
+
+    body = dict(RESUME, experience=[{'position': 'Dev'}, {'years': '2020'}])
+    response = client.post('/api/v1/resume', json=body)
+    assert response.status_code == 400
+    assert response.json['error'] == "experience[1].position: is required"
+
+    response = client.post('/api/v1/resume', json=dict(RESUME, salary=1))
+    assert response.status_code == 400
+    assert response.json['error'] == "salary: is not allowed"
+
+def test_malformed_photo(client):
+    response = client.post('/api/v1/resume', json=dict(RESUME, photo='not base64!'))
+    assert response.status_code == 400
+    assert 'photo' in response.json['error']
+
+def test_wrapped_base64_photo(client):
+    encoded = base64.b64encode(jpeg()).decode()
+    wrapped = '\n'.join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    response = client.post('/api/v1/resume', json=dict(RESUME, photo=wrapped))
+    assert response.status_code == 200
+
+def test_records_use_the_same_base64_rule():
+    assert app_module.record_photo({'photo': base64.b64encode(b'abc').decode()}) == b'abc'
+    with pytest.raises(ValueError):
+        app_module.record_photo({'photo': 'not base64!'})
+    with pytest.raises(ValueError):
+        app_module.record_photo({'photo': 123})
+
+def test_multipart(client):
+    response = client.post('/api/v1/resume', data={
+        'resume': json.dumps(RESUME),
+        'photo': (io.BytesIO(jpeg()), 'photo.jpg'),
+    })
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF-')
+
+def test_multipart_without_resume_part(client):
+    response = client.post('/api/v1/resume', data={'photo': (io.BytesIO(jpeg()), 'photo.jpg')})
+    assert response.status_code == 400
+    assert response.json['error'] == "Missing the 'resume' part"
+
+def test_photo_sent_twice(client):
+    body = dict(RESUME, photo=base64.b64encode(jpeg()).decode())
+    response = client.post('/api/v1/resume', data={
+        'resume': json.dumps(body),
+        'photo': (io.BytesIO(jpeg()), 'photo.jpg'),
+    })
+    assert response.status_code == 400
+
+def test_preview_page_must_be_positive(client):
+    for page in (0, -1):
+        response = client.post(f'/preview?page={page}', json=RESUME)
+        assert response.status_code == 400
+    response = client.post('/preview?page=99', json=RESUME)
+    assert response.status_code == 404
+
+def test_preview_stages_are_labelled_by_output(client):
+    # A record no other test renders, so neither request is a cache hit
+    body = dict(RESUME, name='Metrics Doe')
+    app_module.registry.reset()
+    assert client.post('/preview', json=body).status_code == 200
+    assert client.post('/api/v1/resume', json=body).status_code == 200
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'pdf_stage_seconds_count{stage="layout",output="png"} 1' in metrics
+    assert 'pdf_stage_seconds_count{stage="layout",output="pdf"} 1' in metrics
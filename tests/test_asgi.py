@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module
+import asgi
+
+def scope(method, path, headers=(), query_string=b''):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('test', 80), 'client': ('127.0.0.1', 1234),
+    }
+
+def call(bridge, scope, messages, send=None):
+    """
+    Runs one request through the bridge, receiving messages in turn and then
+    a disconnect, and returns the status and body sent back
+    """
+    messages = list(messages)
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def record(message):
+        sent.append(message)
+        if send is not None:
+            await send(message)
+
+    asyncio.run(bridge(scope, receive, record))
+    if not sent:
+        return None, b''
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_streamed_request_body():
+    body = json.dumps({'name': 'Asgi Doe', 'title': 'Engineer', 'about': 'x' * 10000}).encode()
+    parts = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+    messages = [
+        {'type': 'http.request', 'body': part, 'more_body': i < len(parts) - 1}
+        for i, part in enumerate(parts)
+    ]
+    status, response = call(asgi.app, scope('POST', '/api/v1/resume', [('content-type', 'application/json')]), messages)
+    assert status == 200
+    assert response.startswith(b'%PDF-')
+
+def test_declared_body_too_large():
+    bridge = asgi.AsgiBridge(app_module.app, max_body=100)
+    status, _ = call(bridge, scope('POST', '/generate', [('content-length', '101')]), [])
+    assert status == 413
+
+def test_received_body_too_large():
+    bridge = asgi.AsgiBridge(app_module.app, max_body=100)
+    messages = [{'type': 'http.request', 'body': b'x' * 60, 'more_body': True}] * 2
+    status, _ = call(bridge, scope('POST', '/generate'), messages)
+    assert status == 413
+
+def test_malformed_content_length():
+    for value in ('abc', '-1'):
+        status, _ = call(asgi.app, scope('POST', '/generate', [('content-length', value)]), [])
+        assert status == 400
+
+def test_disconnect_during_upload():
+    messages = [{'type': 'http.request', 'body': b'name=', 'more_body': True}]
+    status, _ = call(asgi.app, scope('POST', '/generate'), messages)
+    assert status is None
+    assert app_module.render_scheduler.stats()['active'] == 0
+
+def test_disconnect_during_response_releases_the_slot():
+    form = b'name=Gone+Doe&title=Engineer&about=hello&phone=1&email=e&address=a'
+    headers = [('content-type', 'application/x-www-form-urlencoded')]
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            raise OSError("client gone")
+
+    admitted = app_module.render_scheduler.stats()['admitted']
+    with pytest.raises(OSError):
+        call(asgi.app, scope('POST', '/generate', headers, b'stream=1'), [{'type': 'http.request', 'body': form}], send)
+    assert app_module.render_scheduler.stats()['admitted'] == admitted + 1
+    wait_until(lambda: app_module.render_scheduler.stats()['active'] == 0)
@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import bulk
+
+def write_input(tmp_path, lines):
+    path = tmp_path / 'export.jsonl'
+    path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+    return str(path)
+
+def record(rid):
+    return json.dumps({'id': rid, 'name': f'Person {rid}', 'title': 'Engineer'})
+
+def checkpointed(out_dir):
+    with open(os.path.join(out_dir, 'checkpoint.txt'), encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def test_renders_and_skips_bad_lines(tmp_path):
+    path = write_input(tmp_path, [record('a'), '{"id": ', '[1, 2]', record('b')])
+    out_dir = str(tmp_path / 'out')
+    result = bulk.render_all(path, out_dir, workers=1, progress_stream=io.StringIO())
+    assert (result.done, result.failed, result.skipped) == (2, 2, 0)
+    assert sorted(checkpointed(out_dir)) == ['a', 'b']
+    for rid in ('a', 'b'):
+        with open(bulk.output_path(out_dir, rid), 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+
+def test_duplicate_ids_fail(tmp_path):
+    path = write_input(tmp_path, [record('a'), record('a')])
+    out_dir = str(tmp_path / 'out')
+    result = bulk.render_all(path, out_dir, workers=1, progress_stream=io.StringIO())
+    assert (result.done, result.failed) == (1, 1)
+    assert checkpointed(out_dir) == ['a']
+
+def test_resumes_an_interrupted_run(tmp_path, monkeypatch):
+    ids = [f'r{i}' for i in range(6)]
+    path = write_input(tmp_path, [record(rid) for rid in ids])
+    out_dir = str(tmp_path / 'out')
+    calls = []
+
+    def interrupting_parse(line):
+        calls.append(line)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        return bulk.parse_jsonl(line)
+
+    monkeypatch.setitem(bulk.READERS, '.jsonl', (bulk.read_jsonl, interrupting_parse))
+    with pytest.raises(KeyboardInterrupt):
+        bulk.render_all(path, out_dir, workers=2, progress_stream=io.StringIO())
+    # Records submitted before the interrupt are still collected
+    assert sorted(checkpointed(out_dir)) == ids[:3]
+
+    monkeypatch.undo()
+    result = bulk.render_all(path, out_dir, workers=2, progress_stream=io.StringIO())
+    assert (result.done, result.failed, result.skipped) == (3, 0, 3)
+    assert sorted(checkpointed(out_dir)) == ids
+    assert all(os.path.exists(bulk.output_path(out_dir, rid)) for rid in ids)
+
+def test_exit_status_is_1_if_a_record_failed(tmp_path):
+    out_dir = str(tmp_path / 'out')
+
+    def run(path):
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'bulk.py'), path, out_dir, '--workers', '1'],
+            capture_output=True,
+        )
+
+    assert run(write_input(tmp_path, [record('a')])).returncode == 0
+    assert run(write_input(tmp_path, [record('a'), 'not json'])).returncode == 1
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from resume import Resume
+
+DATA = {
+    'name': 'Jane Doe', 'title': 'Engineer', 'about': '', 'phone': '', 'email': '', 'address': '',
+    'edu_years': ['2010 - 2014'], 'edu_school': ['MIT'], 'edu_location': ['Boston'],
+}
+
+def test_list_entries_are_split_into_words():
+    resume = Resume.from_data(DATA)
+    assert resume.education[0].years == ('2010', '-', '2014')
+    assert resume.education[0].school == ('MIT',)
+
+def test_years_may_be_integers():
+    resume = Resume.from_data(dict(DATA, edu_years=[2014]))
+    assert resume.education[0].years == ('2014',)
+
+@pytest.mark.parametrize('field, value', [
+    ('edu_years', None),
+    ('edu_years', True),
+    ('edu_years', 2014.5),
+    ('edu_school', {'x': 1}),
+    ('edu_location', 1),
+])
+def test_list_entries_must_be_strings(field, value):
+    with pytest.raises(ValueError) as e:
+        Resume.from_data(dict(DATA, **{field: [value]}))
+    assert str(e.value) == f"Field '{field}' must be a string"
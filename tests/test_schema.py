@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from schema import SchemaError, compile_schema
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'name': {'type': 'string', 'minLength': 1, 'maxLength': 5},
+        'age': {'type': 'integer', 'minimum': 0, 'maximum': 150},
+        'score': {'type': 'number'},
+        'active': {'type': 'boolean'},
+        'tags': {'type': 'array', 'maxItems': 2, 'items': {'type': 'string'}},
+        'jobs': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {'title': {'type': 'string'}},
+                'required': ['title'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['name'],
+    'additionalProperties': False,
+}
+
+validate = compile_schema(SCHEMA)
+
+def error(value):
+    with pytest.raises(SchemaError) as e:
+        validate(value)
+    return e.value
+
+def test_valid_value_is_returned():
+    value = {'name': 'Ann', 'age': 30, 'score': 1.5, 'active': True, 'tags': ['a'], 'jobs': [{'title': 'x'}]}
+    assert validate(value) is value
+
+def test_required():
+    e = error({})
+    assert e.path == 'name'
+    assert str(e) == "name: is required"
+
+def test_types():
+    assert error([]).path == ''
+    assert str(error([])) == "body: expected object"
+    assert str(error({'name': 5})) == "name: expected string"
+    assert str(error({'name': 'a', 'age': 1.5})) == "age: expected integer"
+    assert str(error({'name': 'a', 'score': '1'})) == "score: expected number"
+    assert str(error({'name': 'a', 'active': 1})) == "active: expected boolean"
+
+def test_booleans_are_not_numbers():
+    assert str(error({'name': 'a', 'score': True})) == "score: expected number"
+    assert str(error({'name': 'a', 'age': False})) == "age: expected integer"
+
+def test_lengths():
+    assert str(error({'name': ''})) == "name: length must be at least 1"
+    assert str(error({'name': 'abcdef'})) == "name: length must be at most 5"
+    validate({'name': 'abcde'})
+
+def test_max_items():
+    assert str(error({'name': 'a', 'tags': ['a', 'b', 'c']})) == "tags: number of items must be at most 2"
+
+def test_minimum_and_maximum():
+    assert str(error({'name': 'a', 'age': -1})) == "age: value must be at least 0"
+    assert str(error({'name': 'a', 'age': 151})) == "age: value must be at most 150"
+
+def test_additional_properties():
+    assert str(error({'name': 'a', 'extra': 1})) == "extra: is not allowed"
+
+def test_nested_paths():
+    assert str(error({'name': 'a', 'tags': ['a', 1]})) == "tags[1]: expected string"
+    assert str(error({'name': 'a', 'jobs': [{'title': 'x'}, {}]})) == "jobs[1].title: is required"
+    assert str(error({'name': 'a', 'jobs': [{'title': 'x', 'pay': 1}]})) == "jobs[0].pay: is not allowed"
+
+def test_schema_error_is_a_value_error():
+    assert isinstance(error({}), ValueError)
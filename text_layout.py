@@ -0,0 +1,90 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# One laid out line: its text, measured width and the vertical space it takes
+LineBox = namedtuple('LineBox', 'text width height')
+
+# Widths are cached at this size and scaled, so one entry serves every size
+# a font is used at
+_METRICS_SIZE = 1000.0
+
+@lru_cache(maxsize=65536)
+def _word_width(word, font_name):
+    return stringWidth(word, font_name, _METRICS_SIZE)
+
+def text_width(text, font_name, font_size):
+    """
+    Width of a word or short string, memoized per font
+    """
+    return _word_width(text, font_name) * font_size / _METRICS_SIZE
+
+def _split_word(word, width, font_name, font_size):
+    # Breaks a word wider than the column into pieces that each fit
+    pieces = []
+    piece = ''
+    piece_width = 0
+    for char in word:
+        char_width = text_width(char, font_name, font_size)
+        if piece and piece_width + char_width > width:
+            pieces.append((piece, piece_width))
+            piece = ''
+            piece_width = 0
+        piece += char
+        piece_width += char_width
+    pieces.append((piece, piece_width))
+    return pieces
+
+def layout_text(text, width, font_name="Helvetica", font_size=10, leading=None):
+    """
+    Breaks text, a string or a sequence of words, into lines no wider than
+    width points and returns them as LineBox tuples. Words longer than a
+    whole line are split rather than cut off.
+    """
+    if leading is None:
+        leading = font_size + 4
+    space_width = text_width(' ', font_name, font_size)
+    lines = []
+    words = []
+    line_width = 0
+
+    if isinstance(text, str):
+        text = text.split()
+    for word in text:
+        word_width = text_width(word, font_name, font_size)
+        if word_width > width:
+            if words:
+                lines.append(LineBox(' '.join(words), line_width, leading))
+            pieces = _split_word(word, width, font_name, font_size)
+            for piece, piece_width in pieces[:-1]:
+                lines.append(LineBox(piece, piece_width, leading))
+            words = [pieces[-1][0]]
+            line_width = pieces[-1][1]
+        elif words and line_width + space_width + word_width > width:
+            lines.append(LineBox(' '.join(words), line_width, leading))
+            words = [word]
+            line_width = word_width
+        else:
+            if words:
+                line_width += space_width
+            words.append(word)
+            line_width += word_width
+
+    if words:
+        lines.append(LineBox(' '.join(words), line_width, leading))
+    return lines
+
+def text_height(lines):
+    return sum(line.height for line in lines)
+
+def draw_lines(c, lines, x_pos, y_pos, font_name="Helvetica", font_size=10):
+    """
+    Draws lines from layout_text starting at the given baseline and returns
+    the y position below the last one
+    """
+    c.setFont(font_name, font_size)
+    for line in lines:
+        c.drawString(x_pos, y_pos, line.text)
+        y_pos -= line.height
+    return y_pos
@@ -0,0 +1,468 @@
+import ast
+import hashlib
+import json
+import operator
+import os
+import re
+import threading
+from collections import namedtuple
+
+from reportlab.lib import pagesizes
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from schema import SchemaError, compile_schema
+
+try:
+    import yaml
+except ImportError:
+    # Optional, themes can always be written as JSON
+    yaml = None
+
+# Built in themes, plus those in PDF_THEME_DIR if set, which take precedence
+THEME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'themes')
+DEFAULT_THEME = 'default'
+
+# Sections a column can list, each laid out by its function in layout.py,
+# and their headings unless the theme has its own
+SECTIONS = ('about', 'contact', 'skills', 'education', 'experience')
+DEFAULT_HEADINGS = {
+    'about': "About me",
+    'contact': "Contact",
+    'skills': "Expertise",
+    'education': "Education",
+    'experience': "Experience",
+}
+
+# Theme names end up in file paths and PDF form names
+_NAME = re.compile(r'[a-z0-9_-]+\Z')
+
+# Lengths are in points, given either as numbers or as arithmetic over
+# page_width, page_height and the theme's own dimensions, which are defined
+# in order and may refer to the ones before them
+_LENGTH = {}
+
+def _object(properties, required=()):
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(required),
+        'additionalProperties': False,
+    }
+
+_PLACED_STYLE = _object({'top': _LENGTH, 'style': {'type': 'string'}}, ['top', 'style'])
+
+# Structure of a theme file. Maps with names chosen by the theme (colors,
+# styles, fonts, dimensions and headings) are checked while compiling.
+THEME_SCHEMA = _object({
+    'description': {'type': 'string'},
+    'page': _object({
+        # A name from reportlab.lib.pagesizes, or [width, height]
+        'size': {},
+        'continuation_top': _LENGTH,
+        'bottom_margin': _LENGTH,
+    }),
+    'dimensions': {'type': 'object'},
+    # Name to [r, g, b] with channels from 0 to 1, or to "#rrggbb"
+    'colors': {'type': 'object'},
+    # Name to a TrueType file, relative to the theme file
+    'fonts': {'type': 'object'},
+    # Name to {"font", "size", "color"}
+    'styles': {'type': 'object'},
+    # Filled rectangles behind everything else
+    'regions': {'type': 'array', 'items': _object({
+        # first, continuation or all
+        'pages': {'type': 'string'},
+        'x': _LENGTH,
+        'top': _LENGTH,
+        'width': _LENGTH,
+        'height': _LENGTH,
+        'color': {},
+    }, ['color'])},
+    'photo': _object({
+        'x': _LENGTH,
+        'top': _LENGTH,
+        'size': _LENGTH,
+        # Color of the circle drawn when there is no photo
+        'placeholder': {},
+    }, ['x', 'top', 'size']),
+    'header': _object({
+        'center': _LENGTH,
+        'name': _PLACED_STYLE,
+        'title': _PLACED_STYLE,
+    }, ['center', 'name', 'title']),
+    # Section name to heading text
+    'headings': {'type': 'object'},
+    'columns': {'type': 'array', 'minItems': 1, 'items': _object({
+        'name': {'type': 'string'},
+        'x': _LENGTH,
+        'width': _LENGTH,
+        # Where the column starts on the first page, down from the top edge
+        'top': _LENGTH,
+        'heading': _object({'style': {'type': 'string'}, 'height': _LENGTH}, ['style', 'height']),
+        'text': {'type': 'string'},
+        'entry_heading': {'type': 'string'},
+        'section_space': _LENGTH,
+        'entry_space': _LENGTH,
+        'timeline': _object({'dx': _LENGTH, 'dy': _LENGTH, 'radius': _LENGTH, 'color': {}},
+                            ['dx', 'dy', 'radius', 'color']),
+        'sections': {'type': 'array', 'items': {'type': 'string'}},
+    }, ['name', 'x', 'width', 'top', 'heading', 'text', 'sections'])},
+    'skill_bar': _object({
+        'top': _LENGTH,
+        'width': _LENGTH,
+        'height': _LENGTH,
+        'space': _LENGTH,
+        'track': {},
+        'fill': {},
+    }, ['top', 'width', 'height', 'space', 'track', 'fill']),
+}, ['page', 'styles', 'photo', 'header', 'columns'])
+
+validate_theme = compile_schema(THEME_SCHEMA)
+
+# Font, size and color of a run of text, in the order text ops take them
+Style = namedtuple('Style', 'font size color')
+
+Photo = namedtuple('Photo', 'x top size')
+Header = namedtuple('Header', 'center name title')
+SkillBar = namedtuple('SkillBar', 'top width height space track fill')
+Timeline = namedtuple('Timeline', 'dx dy radius color')
+
+class Column:
+    """
+    One flowing column of a compiled theme. Styles are resolved and lengths
+    evaluated, so laying out a section only reads attributes.
+    """
+    # Hashed by identity: layout sessions key sections by their arguments
+    def __init__(self, name, x, width, top, heading, heading_height, text, entry_heading,
+                 section_space, entry_space, timeline, sections, headings, skill_bar):
+        self.name = name
+        self.x = x
+        self.width = width
+        self.top = top
+        self.heading = heading
+        self.heading_height = heading_height
+        self.text = text
+        self.entry_heading = entry_heading
+        self.section_space = section_space
+        self.entry_space = entry_space
+        self.timeline = timeline
+        self.sections = sections
+        self.headings = headings
+        self.skill_bar = skill_bar
+
+class Theme:
+    """
+    A theme compiled into what layout.py draws with: the page size, the
+    static parts of the design as ready made form ops (backgrounds and the
+    first heading of each column), and the columns. digest identifies the
+    theme's source, for cache keys.
+    """
+    def __init__(self, name, description, digest, page_size, continuation_top, bottom_margin,
+                 first_page, first_page_placeholder, continuation_page, photo, header, columns):
+        self.name = name
+        self.description = description
+        self.digest = digest
+        self.page_size = page_size
+        self.page_width, self.page_height = page_size
+        self.continuation_top = continuation_top
+        self.bottom_margin = bottom_margin
+        self.first_page = first_page
+        self.first_page_placeholder = first_page_placeholder
+        self.continuation_page = continuation_page
+        self.photo = photo
+        self.header = header
+        self.columns = columns
+
+    def __repr__(self):
+        return f"<Theme {self.name}>"
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+def _evaluate(node, names):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id not in names:
+            raise ValueError(f"unknown dimension '{node.id}'")
+        return names[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.left, names), _evaluate(node.right, names))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand, names)
+        return -value if isinstance(node.op, ast.USub) else value
+    raise ValueError("only numbers, dimensions and + - * / are allowed")
+
+def _length(value, names, path):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        raise SchemaError(path, "expected a number or an expression")
+    try:
+        return _evaluate(ast.parse(value, mode='eval').body, names)
+    except SyntaxError:
+        raise SchemaError(path, f"invalid expression '{value}'") from None
+    except (ValueError, ZeroDivisionError) as e:
+        raise SchemaError(path, f"{e} in '{value}'") from None
+
+def _color(value, palette, path):
+    if isinstance(value, str):
+        if value in palette:
+            return palette[value]
+        if re.match(r'#[0-9a-fA-F]{6}\Z', value):
+            return tuple(int(value[i:i + 2], 16) / 255 for i in (1, 3, 5))
+        raise SchemaError(path, f"unknown color '{value}'")
+    if (isinstance(value, list) and len(value) == 3
+            and all(isinstance(c, (int, float)) and not isinstance(c, bool) and 0 <= c <= 1 for c in value)):
+        return tuple(value)
+    raise SchemaError(path, "expected a color name, \"#rrggbb\" or [r, g, b] from 0 to 1")
+
+def _page_size(value):
+    if value is None:
+        return pagesizes.A4
+    if isinstance(value, str):
+        size = getattr(pagesizes, value.upper(), None)
+        if isinstance(size, tuple):
+            return size
+        raise SchemaError('page.size', f"unknown page size '{value}'")
+    if (isinstance(value, list) and len(value) == 2
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0 for v in value)):
+        return tuple(value)
+    raise SchemaError('page.size', "expected a page size name or [width, height]")
+
+def _register_fonts(fonts, base_dir):
+    for name, path in fonts.items():
+        if name in pdfmetrics.getRegisteredFontNames():
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(name, os.path.join(base_dir, path)))
+        except Exception as e:
+            raise SchemaError(f"fonts.{name}", f"cannot load '{path}': {e}") from None
+
+def compile_theme(spec, name, base_dir=THEME_DIR):
+    """
+    Validates a theme spec (the parsed contents of a theme file) and turns it
+    into a Theme. Raises SchemaError, a ValueError, for anything wrong with
+    it. Fonts listed by the theme are registered with ReportLab, relative
+    to base_dir.
+    """
+    validate_theme(spec)
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    page = spec['page']
+    page_size = _page_size(page.get('size'))
+    names = {'page_width': page_size[0], 'page_height': page_size[1]}
+    for key, value in spec.get('dimensions', {}).items():
+        if not _NAME.match(key) or key in names:
+            raise SchemaError(f"dimensions.{key}", "invalid or duplicate name")
+        names[key] = _length(value, names, f"dimensions.{key}")
+
+    def length(value, path):
+        return _length(value, names, path)
+
+    palette = {}
+    for key, value in spec.get('colors', {}).items():
+        palette[key] = _color(value, {}, f"colors.{key}")
+
+    def color(value, path):
+        return _color(value, palette, path)
+
+    _register_fonts(spec.get('fonts', {}), base_dir)
+    registered = set(pdfmetrics.getRegisteredFontNames()) | set(pdfmetrics.standardFonts)
+    styles = {}
+    for key, value in spec['styles'].items():
+        path = f"styles.{key}"
+        if not isinstance(value, dict) or set(value) != {'font', 'size', 'color'}:
+            raise SchemaError(path, "expected an object with font, size and color")
+        if value['font'] not in registered:
+            raise SchemaError(f"{path}.font", f"unknown font '{value['font']}'")
+        styles[key] = Style(value['font'], length(value['size'], f"{path}.size"),
+                            color(value['color'], f"{path}.color"))
+
+    def style(key, path):
+        if key not in styles:
+            raise SchemaError(path, f"unknown style '{key}'")
+        return styles[key]
+
+    width, height = page_size
+    first_ops = []
+    continuation_ops = []
+    for i, region in enumerate(spec.get('regions', [])):
+        path = f"regions[{i}]"
+        x = length(region.get('x', 0), f"{path}.x")
+        top = length(region.get('top', 0), f"{path}.top")
+        w = length(region.get('width', width - x), f"{path}.width")
+        h = length(region.get('height', height - top), f"{path}.height")
+        op = ('rect', x, top + h, w, h, color(region['color'], f"{path}.color"))
+        pages = region.get('pages', 'all')
+        if pages not in ('first', 'continuation', 'all'):
+            raise SchemaError(f"{path}.pages", "expected first, continuation or all")
+        if pages != 'continuation':
+            first_ops.append(op)
+        if pages != 'first':
+            continuation_ops.append(op)
+
+    headings = dict(DEFAULT_HEADINGS)
+    for key, value in spec.get('headings', {}).items():
+        if key not in headings or not isinstance(value, str):
+            raise SchemaError(f"headings.{key}", "expected a section name and its heading text")
+        headings[key] = value
+
+    skill_bar = None
+    if 'skill_bar' in spec:
+        bar = spec['skill_bar']
+        skill_bar = SkillBar(
+            *(length(bar[key], f"skill_bar.{key}") for key in ('top', 'width', 'height', 'space')),
+            color(bar['track'], 'skill_bar.track'), color(bar['fill'], 'skill_bar.fill'),
+        )
+
+    columns = []
+    for i, column in enumerate(spec['columns']):
+        path = f"columns[{i}]"
+        sections = tuple(column['sections'])
+        for j, section in enumerate(sections):
+            if section not in SECTIONS:
+                raise SchemaError(f"{path}.sections[{j}]", f"unknown section '{section}'")
+            if section == 'skills' and skill_bar is None:
+                raise SchemaError(f"{path}.sections[{j}]", "the skills section needs a skill_bar")
+        timeline = None
+        if 'timeline' in column:
+            dot = column['timeline']
+            timeline = Timeline(
+                *(length(dot[key], f"{path}.timeline.{key}") for key in ('dx', 'dy', 'radius')),
+                color(dot['color'], f"{path}.timeline.color"),
+            )
+        text = style(column['text'], f"{path}.text")
+        columns.append(Column(
+            name=column['name'],
+            x=length(column['x'], f"{path}.x"),
+            width=length(column['width'], f"{path}.width"),
+            top=length(column['top'], f"{path}.top"),
+            heading=style(column['heading']['style'], f"{path}.heading.style"),
+            heading_height=length(column['heading']['height'], f"{path}.heading.height"),
+            text=text,
+            entry_heading=style(column['entry_heading'], f"{path}.entry_heading")
+            if 'entry_heading' in column else text,
+            section_space=length(column.get('section_space', 0), f"{path}.section_space"),
+            entry_space=length(column.get('entry_space', 0), f"{path}.entry_space"),
+            timeline=timeline,
+            sections=sections,
+            headings=headings,
+            skill_bar=skill_bar,
+        ))
+
+    # The first heading of each column always opens the first page, so it
+    # is drawn with the background
+    for column in columns:
+        if column.sections:
+            first_ops.append(('text', column.x, column.top, headings[column.sections[0]]) + column.heading)
+
+    photo_spec = spec['photo']
+    photo = Photo(*(length(photo_spec[key], f"photo.{key}") for key in ('x', 'top', 'size')))
+    first_page = ('form', f"{name}_first_page", tuple(first_ops))
+    first_page_placeholder = first_page
+    if 'placeholder' in photo_spec:
+        radius = photo.size / 2
+        circle = ('circle', photo.x + radius, radius + photo.top, radius,
+                  color(photo_spec['placeholder'], 'photo.placeholder'))
+        first_page_placeholder = ('form', f"{name}_first_page_placeholder", tuple(first_ops) + (circle,))
+
+    header = spec['header']
+    return Theme(
+        name=name,
+        description=spec.get('description', ''),
+        digest=digest,
+        page_size=page_size,
+        continuation_top=length(page.get('continuation_top', 50), 'page.continuation_top'),
+        bottom_margin=length(page.get('bottom_margin', 40), 'page.bottom_margin'),
+        first_page=first_page,
+        first_page_placeholder=first_page_placeholder,
+        continuation_page=(('form', f"{name}_page", tuple(continuation_ops)),) if continuation_ops else (),
+        photo=photo,
+        header=Header(
+            length(header['center'], 'header.center'),
+            *((length(header[key]['top'], f"header.{key}.top"), style(header[key]['style'], f"header.{key}.style"))
+              for key in ('name', 'title')),
+        ),
+        columns=tuple(columns),
+    )
+
+def theme_dirs():
+    extra = os.environ.get('PDF_THEME_DIR')
+    return [extra, THEME_DIR] if extra else [THEME_DIR]
+
+def _extensions():
+    return ('.json', '.yaml', '.yml') if yaml is not None else ('.json',)
+
+def _theme_path(name):
+    for directory in theme_dirs():
+        for extension in _extensions():
+            path = os.path.join(directory, name + extension)
+            if os.path.isfile(path):
+                return path
+    return None
+
+def available_themes():
+    """
+    Names of the themes that can be loaded, sorted
+    """
+    names = set()
+    for directory in theme_dirs():
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            stem, extension = os.path.splitext(filename)
+            if extension in _extensions() and _NAME.match(stem):
+                names.add(stem)
+    return sorted(names)
+
+def load_theme(path, name):
+    """
+    Reads and compiles a theme file
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            spec = json.load(f)
+        else:
+            spec = yaml.safe_load(f)
+    try:
+        return compile_theme(spec, name, os.path.dirname(path))
+    except SchemaError as e:
+        raise SchemaError(e.path, f"{e.message} (in {path})") from None
+
+# Themes are compiled once per process, on first use or by load_themes
+_themes = {}
+_themes_lock = threading.Lock()
+
+def get_theme(name=None):
+    """
+    Looks up a compiled theme by name, None meaning the default one. Raises
+    ValueError for unknown names.
+    """
+    if name is None:
+        name = DEFAULT_THEME
+    if isinstance(name, Theme):
+        return name
+    theme = _themes.get(name)
+    if theme is not None:
+        return theme
+    path = _theme_path(name) if isinstance(name, str) and _NAME.match(name) else None
+    if path is None:
+        raise ValueError(f"Unknown theme '{name}', expected one of {', '.join(available_themes())}")
+    with _themes_lock:
+        theme = _themes.get(name)
+        if theme is None:
+            theme = _themes[name] = load_theme(path, name)
+    return theme
+
+def load_themes():
+    """
+    Compiles every available theme up front, so a broken theme file fails
+    at startup rather than on the first request using it
+    """
+    return {name: get_theme(name) for name in available_themes()}